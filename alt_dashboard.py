@@ -2,19 +2,24 @@
 # IMPORTS #
 ###########
 
+import os
+import sys
+
 import dash
 from dash import dcc, html
-import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_pipeline'))
+from moisture_cube import MoistureCube
 
 #########
 # SETUP #
 #########
 
-# Load data
-df = pd.read_parquet('moisture.parquet')
+# Open the moisture cube; chunks are read on demand
+cube = MoistureCube('moisture_cube')
 
-# Log number of rows
-print(f"Total rows: {len(df)}")
+# Log the cube's (time, lat, lon) shape
+print(f"Cube shape: {cube.shape}")
 
 # Initialize the app object
 app = dash.Dash(__name__)
@@ -0,0 +1,71 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Per-cell accumulators; a mean is a sum divided by the count afterwards
+REDUCTIONS = {
+    'mean': np.add,
+    'max': np.fmax,
+    'min': np.fmin,
+}
+
+# Reduced layers kept per (variable, window, reduction)
+CACHE_SIZE = 128
+
+
+class WindowAggregator:
+    def __init__(self, df):
+        self.df = df
+
+        # Integer cell and day codes per row from the table's shared index;
+        # reductions scatter rows into one value per cell, so no
+        # (date x cell) array is ever built
+        self.cell_lat = df.index['cell_lat']
+        self.cell_lon = df.index['cell_lon']
+        self.cell_codes = df.index['cell_code']
+        self.dates = pd.DatetimeIndex(df.index['dates'])
+        self.date_codes = df.index['date_code']
+
+        self.reduce = lru_cache(maxsize=CACHE_SIZE)(self._reduce)
+
+    def _reduce(self, variable: str, start: pd.Timestamp, end: pd.Timestamp, how: str) -> np.ndarray:
+        first = self.dates.searchsorted(start, side='left')
+        last = self.dates.searchsorted(end, side='right')
+        rows = np.flatnonzero((self.date_codes >= first) & (self.date_codes < last) & (self.cell_codes >= 0))
+
+        values = np.asarray(self.df[variable], dtype=np.float64)[rows]
+        cells = self.cell_codes[rows]
+        valid = ~np.isnan(values)
+        values, cells = values[valid], cells[valid]
+
+        # Cells without a value in the window come out as NaN
+        n_cells = len(self.cell_lat)
+        if how == 'mean':
+            count = np.bincount(cells, minlength=n_cells)
+            total = np.bincount(cells, weights=values, minlength=n_cells)
+            with np.errstate(invalid='ignore'):
+                result = total / count
+        else:
+            result = np.full(n_cells, np.nan)
+            REDUCTIONS[how].at(result, cells, values)
+        return result.astype(np.float32)
+
+    def window(self, variable: str, start, end, how: str='mean') -> np.ndarray:
+        return self.reduce(variable, pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), how)
+
+    def compare(self, variable: str, window_a, window_b, how: str='mean') -> np.ndarray:
+        # Change from window A to window B; a single date is a one-day window
+        return self.window(variable, *window_b, how=how) - self.window(variable, *window_a, how=how)
+
+    def layer(self, variable: str, values: np.ndarray, lat_min: float, lat_max: float,
+              lon_min: float, lon_max: float) -> pd.DataFrame:
+        # One pre-reduced value per visible cell, ready to plot
+        keep = (~np.isnan(values) &
+                (self.cell_lat >= lat_min) & (self.cell_lat <= lat_max) &
+                (self.cell_lon >= lon_min) & (self.cell_lon <= lon_max))
+        return pd.DataFrame({
+            'sif_lat': self.cell_lat[keep],
+            'sif_lon': self.cell_lon[keep],
+            variable: values[keep],
+        })
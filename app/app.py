@@ -2,12 +2,22 @@
 # IMPORTS #
 ###########
 
+import os
+import sys
 from typing import Tuple
 import dash
 from dash import callback_context, dcc, html, Input, Output, no_update
 import plotly.express as px
 import plotly.graph_objs as go
 import pandas as pd
+from flask import Response, jsonify, request, stream_with_context
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from data_service import open_table
+from aggregate import REDUCTIONS, WindowAggregator
+from export import EXPORT_FORMATS, export_batches, frame_batches, stream_export
+from on_demand import OnDemandPredictor
+from zonal import DEFAULT_PERCENTILES, DEFAULT_VARIABLES, ZonalStats
 
 #########
 # SETUP #
@@ -17,10 +27,16 @@ import pandas as pd
 TEST_DATA = 'data/sif_moisture/sif_moisture.parquet'
 PREDICTED_DATA = 'data/sif_moisture/sif_moisture_predicted.parquet'
 INPAINTED_DATA = 'data/sif_moisture/sif_moisture_inpaint.parquet'
+FILLED_DATA = 'data/sif_moisture/sif_moisture_filled.parquet'
 PRODUCTION_DATA = ''
 
 CURRENT_DATA = TEST_DATA
 # CURRENT_DATA = INPAINTED_DATA
+# CURRENT_DATA = FILLED_DATA
+
+# Lag features and model for scoring dates without cached predictions
+FEATURE_STORE = '../feature_store'
+MODEL_FILE = '../linear_fit.joblib'
 
 # Info message
 INFO_MESSAGE = [
@@ -63,13 +79,27 @@ EXAMPLES = [
 # Turn on debounce to improve performance
 DEBOUNCE = False
 
-# Load data
-df = pd.read_parquet(CURRENT_DATA)
-df['date'] = pd.to_datetime(df['date'], errors='coerce')
+# Load data, shared with the other dashboards when data_service.py is running
+df = open_table(CURRENT_DATA)
 
 # Log number of rows
 print(f"Total rows: {len(df)}")
 
+# Zone rasterizations are cached against this dataset's cell grid
+zonal_stats = ZonalStats(df)
+
+# Rows binned onto SMAP cells, so soundings and gridded data both get
+# aligned per-cell arrays for range and compare queries
+aggregator = WindowAggregator(df)
+
+# Days the dataset has rows for; an empty box on one of these is just empty
+dataset_dates = pd.DatetimeIndex(df.index['dates'])
+
+# Predict on demand for any archived date the dataset doesn't cover
+predictor = None
+if os.path.isdir(FEATURE_STORE) and os.path.exists(MODEL_FILE):
+    predictor = OnDemandPredictor(FEATURE_STORE, MODEL_FILE)
+
 # Initialize the app object
 app = dash.Dash(__name__)
 
@@ -154,10 +184,55 @@ def data_type_dropdown() -> html.Div:
     ], className='input-group')
     return result
 
+# Build the single-date / range / compare controls
+def aggregation_controls() -> html.Div:
+    result = html.Div([
+        html.Label("View:"),
+        dcc.RadioItems(
+            id='view-mode',
+            options=[
+                {'label': 'Single Date', 'value': 'single'},
+                {'label': 'Date Range', 'value': 'range'},
+                {'label': 'Compare', 'value': 'compare'},
+            ],
+            value='single',
+            inline=True,
+        ),
+        dcc.Dropdown(
+            id='reduction-dropdown',
+            options=[{'label': name.capitalize(), 'value': name} for name in REDUCTIONS],
+            value='mean',
+            clearable=False,
+            className='dropdown-field'
+        ),
+    ], className='input-group')
+    return result
+
+# Build a range slider over the dataset's dates
+def date_range_slider(slider_id: str) -> dcc.RangeSlider:
+    first_date = aggregator.dates.min()
+    last_date = aggregator.dates.max()
+
+    result = dcc.RangeSlider(
+        id=slider_id,
+        min=first_date.timestamp(),
+        max=last_date.timestamp(),
+        value=[first_date.timestamp(), last_date.timestamp()],
+        marks={
+            int(date.timestamp()): date.strftime('%Y-%m-%d')
+            for date in aggregator.dates
+        },
+        step=None
+    )
+    return result
+
 # Build the date-slider
 def date_time_slider() -> dcc.Slider:
-    first_date = df['date'].min()
-    last_date = df['date'].max()
+    first_date = df.min('date')
+    last_date = df.max('date')
+    if predictor is not None:
+        first_date = min(first_date, predictor.dates.min())
+        last_date = max(last_date, predictor.dates.max())
 
     result = dcc.Slider(
         id='date-time-slider',
@@ -181,6 +256,7 @@ app.layout = html.Div([
         # Controls container
         html.Div([
             data_type_dropdown(),
+            aggregation_controls(),
             latitude_controls(),
             longitude_controls(),
             presentation_info(),
@@ -196,6 +272,11 @@ app.layout = html.Div([
     # Slider container
     html.Div([
         date_time_slider(),
+        # Window A is the range in range mode, the baseline in compare mode
+        html.Label("Window A:"),
+        date_range_slider('window-a-slider'),
+        html.Label("Window B:"),
+        date_range_slider('window-b-slider'),
     ], className='slider-container'),
 ], className='main-container')
 
@@ -208,22 +289,44 @@ app.layout = html.Div([
      Input('lon-min-input', 'value'),
      Input('lon-max-input', 'value'),
      Input('date-time-slider', 'value'),
-     Input('map-zoom-store', 'data')],
+     Input('map-zoom-store', 'data'),
+     Input('view-mode', 'value'),
+     Input('reduction-dropdown', 'value'),
+     Input('window-a-slider', 'value'),
+     Input('window-b-slider', 'value')],
 )
 def update_map(
     selected_data_type: str, lat_min: float, lat_max: float, lon_min: float,
-    lon_max: float, selected_timestamp: str, zoom_state: dict
+    lon_max: float, selected_timestamp: str, zoom_state: dict, view_mode: str,
+    reduction: str, window_a: list, window_b: list
 ) -> go.Figure:
 
-    # Convert selected_timestamp to datetime
-    selected_datetime = pd.to_datetime(selected_timestamp, unit='s')
-
-    # Filter the data frame based on user-input
-    filtered_df = df[
-        (df['sif_lat'].between(lat_min, lat_max)) &
-        (df['sif_lon'].between(lon_min, lon_max)) &
-        (df['date'] == selected_datetime)
-    ]
+    title = None
+
+    # Range and compare views are reduced server-side to one value per cell
+    if view_mode in ('range', 'compare'):
+        window_a = [pd.to_datetime(value, unit='s') for value in window_a]
+        window_b = [pd.to_datetime(value, unit='s') for value in window_b]
+        if view_mode == 'range':
+            values = aggregator.window(selected_data_type, *window_a, how=reduction)
+        else:
+            values = aggregator.compare(selected_data_type, window_a, window_b, how=reduction)
+        filtered_df = aggregator.layer(selected_data_type, values, lat_min, lat_max, lon_min, lon_max)
+
+    else:
+        # Convert selected_timestamp to datetime
+        selected_datetime = pd.to_datetime(selected_timestamp, unit='s')
+
+        if predictor is not None and selected_datetime.normalize() not in dataset_dates:
+            # The dataset has nothing for this day, score it from the feature store
+            filtered_df = predictor.predict(selected_datetime, lat_min, lat_max, lon_min, lon_max)
+            title = f"Model prediction for {selected_datetime.date()} (no observations on this day)"
+        else:
+            # Filter the data frame based on user-input
+            filtered_df = df.query(
+                equals={'date': selected_datetime},
+                between={'sif_lat': (lat_min, lat_max), 'sif_lon': (lon_min, lon_max)},
+            )
 
     # Extract zoom from zoom_state
     current_zoom = zoom_state.get('zoom', 3)
@@ -237,7 +340,7 @@ def update_map(
         zoom=current_zoom,
         opacity=0.3,
     )
-    figure.update_layout(mapbox_style="open-street-map")
+    figure.update_layout(mapbox_style="open-street-map", title=title)
     return figure
 
 # Callback to track changes in the map's zoom level
@@ -288,6 +391,66 @@ def update_coordinates(
 
     return lat_min, lat_max, lon_min, lon_max, {'zoom': zoom}
 
+# Per-zone summaries for GeoJSON fields, counties or custom polygons
+@app.server.route('/api/zonal-stats', methods=['POST'])
+def zonal_stats_route():
+    body = request.get_json(force=True)
+    if not body or 'geojson' not in body:
+        return jsonify({'error': "Request body needs a 'geojson' field"}), 400
+
+    try:
+        result = zonal_stats.compute(
+            body['geojson'],
+            start=body.get('start'),
+            end=body.get('end'),
+            variables=body.get('variables', DEFAULT_VARIABLES),
+            percentiles=body.get('percentiles', DEFAULT_PERCENTILES),
+        )
+    except (KeyError, TypeError, ValueError) as error:
+        return jsonify({'error': str(error)}), 400
+
+    # to_json writes NaN as null for zones without data
+    return app.server.response_class(result.to_json(orient='records'), mimetype='application/json')
+
+# Stream the rows behind a map view (same filters as update_map) as a download
+@app.server.route('/api/export', methods=['GET'])
+def export_route():
+    args = request.args
+    data_type = args.get('data_type', 'sif_value')
+    export_format = args.get('format', 'csv')
+    if data_type not in ('sif_value', 'water_prev1', 'root_water_prev1'):
+        return jsonify({'error': f"Unknown data_type: {data_type}"}), 400
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format: {export_format}"}), 400
+
+    # A single 'date' or a 'start'/'end' range; no date exports everything
+    start = args.get('start', args.get('date'))
+    end = args.get('end', args.get('date'))
+    bbox = {
+        'lat_min': args.get('lat_min', -90.0, type=float),
+        'lat_max': args.get('lat_max', 90.0, type=float),
+        'lon_min': args.get('lon_min', -180.0, type=float),
+        'lon_max': args.get('lon_max', 180.0, type=float),
+    }
+
+    try:
+        single_day = start is not None and pd.Timestamp(start).normalize() == pd.Timestamp(end).normalize()
+        if single_day and predictor is not None and pd.Timestamp(start).normalize() not in dataset_dates:
+            # Same fallback as the map: a day the dataset lacks is predicted on demand
+            predicted = predictor.predict(start, **bbox)
+            schema, batches = frame_batches(predicted[['date', 'sif_lat', 'sif_lon', data_type, 'source']])
+        else:
+            schema, batches = export_batches(CURRENT_DATA, data_type, start=start, end=end, **bbox)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return Response(
+        stream_with_context(stream_export(schema, batches, export_format)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=root_access_{data_type}.{extension}'},
+    )
+
 
 # Run the server
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+BATCH_SIZE = 64_000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    # File-like sink that hands bytes back as they are written. tell() keeps
+    # counting across drains so Parquet footer offsets stay correct.
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _date_bound(field_type, value):
+    # Dates are ISO strings in sif_moisture.parquet but timestamps in the
+    # predicted outputs; compare in whichever type is on disk
+    timestamp = pd.Timestamp(value)
+    if pa.types.is_string(field_type) or pa.types.is_large_string(field_type):
+        return timestamp.strftime('%Y-%m-%d')
+    return pa.scalar(timestamp, type=field_type)
+
+
+def export_filter(dataset, lat_min, lat_max, lon_min, lon_max, start=None, end=None):
+    expression = ((ds.field('sif_lat') >= lat_min) & (ds.field('sif_lat') <= lat_max) &
+                  (ds.field('sif_lon') >= lon_min) & (ds.field('sif_lon') <= lon_max))
+    date_type = dataset.schema.field('date').type
+    if start is not None:
+        expression &= ds.field('date') >= _date_bound(date_type, start)
+    if end is not None:
+        expression &= ds.field('date') <= _date_bound(date_type, end)
+    return expression
+
+
+def export_batches(path, data_type, lat_min, lat_max, lon_min, lon_max, start=None, end=None):
+    # Filters are pushed into the scan, so only matching row groups are read
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    columns = ['date', 'sif_lat', 'sif_lon', data_type]
+    schema = pa.schema([dataset.schema.field(column) for column in columns])
+    expression = export_filter(dataset, lat_min, lat_max, lon_min, lon_max, start, end)
+    return schema, dataset.to_batches(columns=columns, filter=expression, batch_size=BATCH_SIZE)
+
+
+def frame_batches(df):
+    # Rows already in memory, such as on-demand predictions, in the same form
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return table.schema, table.to_batches(max_chunksize=BATCH_SIZE)
+
+
+def stream_export(schema, batches, export_format):
+    sink = _ChunkSink()
+
+    # Open the output up front so an export with no matching rows is still a valid file
+    writer = None
+    if export_format == 'csv':
+        pa_csv.write_csv(schema.empty_table(), sink)
+    elif export_format == 'arrow':
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+    else:
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    yield sink.drain()
+
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+
+        # Each batch becomes a CSV block, an IPC message or a Parquet row group
+        if writer is None:
+            pa_csv.write_csv(batch, sink, write_options=pa_csv.WriteOptions(include_header=False))
+        else:
+            writer.write_batch(batch)
+        yield sink.drain()
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
@@ -0,0 +1,39 @@
+import os
+import sys
+from functools import lru_cache
+
+import joblib
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_pipeline'))
+from feature_store import FeatureStore
+
+# Distinct (date, bbox) predictions kept in memory
+CACHE_SIZE = 64
+
+
+class OnDemandPredictor:
+    def __init__(self, store_path: str, model_path: str, cache_size: int=CACHE_SIZE):
+        self.store = FeatureStore(store_path)
+        self.model = joblib.load(model_path)
+        self.dates = self.store.dates
+
+        # Least-recently-used views are evicted once the cache is full
+        self._predict = lru_cache(maxsize=cache_size)(self._score)
+
+    def _score(self, date: pd.Timestamp, lat_min: float, lat_max: float,
+               lon_min: float, lon_max: float) -> pd.DataFrame:
+        df = self.store.gather(date, lat_min, lat_max, lon_min, lon_max)
+
+        # One vectorized batch for every visible cell
+        df['sif_value'] = self.model.predict(df[self.store.features]) if len(df) else []
+        df.insert(0, 'date', date)
+        # Lets exports and callers tell model output from observations
+        df['source'] = 'predicted'
+        print(f"Scored {len(df)} cells for {date.date()}")
+        return df
+
+    def predict(self, date, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> pd.DataFrame:
+        # Inputs are rounded to 3 decimals by the controls, so the key is stable
+        return self._predict(pd.Timestamp(date).normalize(), round(lat_min, 3), round(lat_max, 3),
+                             round(lon_min, 3), round(lon_max, 3))
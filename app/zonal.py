@@ -0,0 +1,159 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from matplotlib.path import Path
+
+# Rasterized zone sets kept in memory, least recently used evicted first
+ZONE_CACHE_SIZE = 32
+DEFAULT_VARIABLES = ['sif_value', 'water_prev1', 'root_water_prev1']
+DEFAULT_PERCENTILES = [10, 50, 90]
+
+
+def _polygons(geometry):
+    # GeoJSON Polygon / MultiPolygon as a list of [outer, *holes] rings
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+
+def _features(geojson):
+    if geojson['type'] == 'FeatureCollection':
+        return geojson['features']
+    if geojson['type'] == 'Feature':
+        return [geojson]
+    return [{'type': 'Feature', 'properties': {}, 'geometry': geojson}]
+
+
+def _zone_name(feature, i):
+    properties = feature.get('properties') or {}
+    return str(feature.get('id', properties.get('name', properties.get('id', i))))
+
+
+def rasterize(geojson, cell_lat, cell_lon):
+    # Cell indices whose centre falls inside each zone, as a CSR pair
+    points = np.column_stack((cell_lon, cell_lat))
+    names, zone_cells = [], []
+    for i, feature in enumerate(_features(geojson)):
+        inside = np.zeros(len(points), dtype=bool)
+        for rings in _polygons(feature['geometry']):
+            outer, holes = rings[0], rings[1:]
+
+            # Bounding-box prefilter before the exact point-in-polygon test
+            outer = np.asarray(outer, dtype=np.float64)[:, :2]
+            (lon_min, lat_min), (lon_max, lat_max) = outer.min(axis=0), outer.max(axis=0)
+            candidates = np.flatnonzero((cell_lon >= lon_min) & (cell_lon <= lon_max) &
+                                        (cell_lat >= lat_min) & (cell_lat <= lat_max))
+            hit = Path(outer).contains_points(points[candidates])
+            for hole in holes:
+                hit &= ~Path(np.asarray(hole, dtype=np.float64)[:, :2]).contains_points(points[candidates])
+            inside[candidates[hit]] = True
+
+        names.append(_zone_name(feature, i))
+        zone_cells.append(np.flatnonzero(inside))
+
+    # Seeded with int64 so an empty collection still gives integer offsets
+    zone_ptr = np.concatenate((np.zeros(1, dtype=np.int64),
+                               np.cumsum([len(cells) for cells in zone_cells], dtype=np.int64)))
+    zone_cells = np.concatenate(zone_cells) if zone_cells else np.empty(0, dtype=np.int64)
+    return names, zone_ptr, zone_cells
+
+
+class ZonalStats:
+    def __init__(self, df):
+        self.df = df
+
+        # Fixed SMAP land cells from the table's shared index; each row is
+        # mapped to the cell under it, so zones rasterize once per grid
+        self.cell_lat = df.index['cell_lat']
+        self.cell_lon = df.index['cell_lon']
+        self.cell_codes = df.index['cell_code']
+        self.dates = df['date']
+
+        # Hash of the grid, so cached rasterizations are invalidated with it
+        grid = hashlib.sha256(self.cell_lat.tobytes())
+        grid.update(self.cell_lon.tobytes())
+        self.grid_key = grid.hexdigest()[:16]
+        self._zone_cache = OrderedDict()
+
+    def zones(self, geojson: dict):
+        key = hashlib.sha256((self.grid_key + json.dumps(geojson, sort_keys=True)).encode()).hexdigest()
+        if key in self._zone_cache:
+            self._zone_cache.move_to_end(key)
+            return self._zone_cache[key]
+
+        zones = rasterize(geojson, self.cell_lat, self.cell_lon)
+        self._zone_cache[key] = zones
+        if len(self._zone_cache) > ZONE_CACHE_SIZE:
+            self._zone_cache.popitem(last=False)
+        return zones
+
+    def compute(self, geojson: dict, start=None, end=None, variables=DEFAULT_VARIABLES,
+                percentiles=DEFAULT_PERCENTILES) -> pd.DataFrame:
+        percentiles = [float(q) for q in percentiles]
+        out_of_range = [q for q in percentiles if not 0 <= q <= 100]
+        if out_of_range:
+            raise ValueError(f"Percentiles must be between 0 and 100, got {out_of_range}")
+
+        names, zone_ptr, zone_cells = self.zones(geojson)
+        n_zones = len(names)
+
+        # Rows in the date range that land on a grid cell, grouped by cell
+        in_range = self.cell_codes >= 0
+        if start is not None:
+            in_range &= self.dates >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            in_range &= self.dates <= np.datetime64(pd.Timestamp(end))
+        rows = np.flatnonzero(in_range)
+        rows = rows[np.argsort(self.cell_codes[rows], kind='stable')]
+        cell_count = np.bincount(self.cell_codes[rows], minlength=len(self.cell_lat))
+        cell_start = np.cumsum(cell_count) - cell_count
+
+        # Expand (zone, cell) membership into (zone, row) pairs; zones may overlap
+        pair_zone = np.repeat(np.arange(n_zones), np.diff(zone_ptr))
+        per_pair = cell_count[zone_cells]
+        total = per_pair.sum()
+        offsets = np.arange(total) - np.repeat(np.cumsum(per_pair) - per_pair, per_pair)
+        row_idx = rows[np.repeat(cell_start[zone_cells], per_pair) + offsets]
+        row_zone = np.repeat(pair_zone, per_pair)
+
+        result = pd.DataFrame({'zone': names, 'n_cells': np.diff(zone_ptr)})
+        for variable in variables:
+            values = np.asarray(self.df[variable], dtype=np.float64)[row_idx]
+            valid = ~np.isnan(values)
+            zone, values = row_zone[valid], values[valid]
+
+            count = np.bincount(zone, minlength=n_zones)
+            total = np.bincount(zone, weights=values, minlength=n_zones)
+            has_data = count > 0
+
+            # Sort by (zone, value); each zone is then a contiguous sorted run
+            order = np.lexsort((values, zone))
+            values = values[order]
+            group_start = np.cumsum(count) - count
+
+            result[f'{variable}_count'] = count
+            result[f'{variable}_mean'] = np.where(has_data, total / np.maximum(count, 1), np.nan)
+            if has_data.any():
+                starts = group_start[has_data]
+                result.loc[has_data, f'{variable}_min'] = np.minimum.reduceat(values, starts)
+                result.loc[has_data, f'{variable}_max'] = np.maximum.reduceat(values, starts)
+            else:
+                result[f'{variable}_min'] = np.nan
+                result[f'{variable}_max'] = np.nan
+
+            # Linear-interpolated percentiles straight from the sorted runs
+            for q in percentiles:
+                position = group_start + (q / 100.0) * np.maximum(count - 1, 0)
+                lower = np.floor(position).astype(np.int64)
+                upper = np.ceil(position).astype(np.int64)
+                lower_value = values[np.minimum(lower, len(values) - 1)] if len(values) else np.zeros(n_zones)
+                upper_value = values[np.minimum(upper, len(values) - 1)] if len(values) else np.zeros(n_zones)
+                percentile = lower_value + (upper_value - lower_value) * (position - lower)
+                result[f'{variable}_p{q:g}'] = np.where(has_data, percentile, np.nan)
+
+        return result
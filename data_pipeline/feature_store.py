@@ -0,0 +1,80 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from moisture_cube import MoistureCube
+
+INDEX_FILE = 'index.json'
+
+
+def feature_names(n_days=3):
+    # Same order as FEATURES in model/model.py
+    names = []
+    for k in range(1, n_days + 1):
+        names += [f'water_prev{k}', f'root_water_prev{k}']
+    return names
+
+
+def build_feature_store(cube_path='moisture_cube', path='feature_store', n_days=3):
+    cube = MoistureCube(cube_path)
+    days, cell_lat, cell_lon, moisture = cube.read_daily_cells()
+    surface = moisture['surface_soil_moisture']
+    root = moisture['root_zone_soil_moisture']
+
+    # Lag features for every archived day; lags outside the archive stay NaN
+    dates = pd.date_range(days.min(), days.max(), freq='D')
+    day_index = days.get_indexer(dates)
+    names = feature_names(n_days)
+
+    os.makedirs(path, exist_ok=True)
+    features = np.lib.format.open_memmap(
+        os.path.join(path, 'features.npy'), mode='w+', dtype=np.float32,
+        shape=(len(dates), len(cell_lat), len(names)),
+    )
+    for t in range(len(dates)):
+        for k in range(1, n_days + 1):
+            lag = day_index[t - k] if t - k >= 0 else -1
+            features[t, :, 2 * (k - 1)] = surface[lag] if lag >= 0 else np.nan
+            features[t, :, 2 * (k - 1) + 1] = root[lag] if lag >= 0 else np.nan
+    features.flush()
+
+    np.save(os.path.join(path, 'cell_lat.npy'), cell_lat)
+    np.save(os.path.join(path, 'cell_lon.npy'), cell_lon)
+    with open(os.path.join(path, INDEX_FILE), 'w') as f:
+        json.dump({'dates': [date.strftime('%Y-%m-%d') for date in dates], 'features': names}, f)
+
+    print(f"Wrote feature store {features.shape} to {path}")
+
+
+class FeatureStore:
+    def __init__(self, path='feature_store'):
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.dates = pd.DatetimeIndex(index['dates'])
+        self.features = index['features']
+        self.cell_lat = np.load(os.path.join(path, 'cell_lat.npy'))
+        self.cell_lon = np.load(os.path.join(path, 'cell_lon.npy'))
+        self.values = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+
+    def gather(self, date, lat_min=-90.0, lat_max=90.0, lon_min=-180.0, lon_max=180.0):
+        # Features for the cells in the box with a complete set of lags
+        t = self.dates.get_indexer([pd.Timestamp(date).normalize()])[0]
+        if t < 0:
+            return pd.DataFrame(columns=['sif_lat', 'sif_lon'] + self.features)
+
+        cells = np.flatnonzero((self.cell_lat >= lat_min) & (self.cell_lat <= lat_max) &
+                               (self.cell_lon >= lon_min) & (self.cell_lon <= lon_max))
+        X = np.asarray(self.values[t, cells])
+        complete = ~np.isnan(X).any(axis=1)
+        cells, X = cells[complete], X[complete]
+
+        df = pd.DataFrame(X, columns=self.features)
+        df.insert(0, 'sif_lat', self.cell_lat[cells])
+        df.insert(1, 'sif_lon', self.cell_lon[cells])
+        return df
+
+
+if __name__ == "__main__":
+    build_feature_store()
@@ -0,0 +1,128 @@
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from moisture_cube import MoistureCube
+from storage import read_parquet, write_parquet
+
+# Longest run of missing days bridged by interpolation
+MAX_SIF_GAP_DAYS = 5
+MAX_MOISTURE_GAP_DAYS = 2
+
+
+def interpolate_time(values, max_gap):
+    # Linear interpolation along axis 0 for every column at once. Only gaps
+    # of at most max_gap days with an observation on both sides are filled.
+    n_days = values.shape[0]
+    day = np.arange(n_days)[:, None]
+    valid = ~np.isnan(values)
+
+    # Index of the previous / next valid day for every (day, cell)
+    prev = np.maximum.accumulate(np.where(valid, day, -1), axis=0)
+    next_ = np.minimum.accumulate(np.where(valid, day, n_days)[::-1], axis=0)[::-1]
+
+    bracketed = ~valid & (prev >= 0) & (next_ < n_days) & (next_ - prev - 1 <= max_gap)
+    prev_value = np.take_along_axis(values, np.clip(prev, 0, n_days - 1), axis=0)
+    next_value = np.take_along_axis(values, np.clip(next_, 0, n_days - 1), axis=0)
+    weight = (day - prev) / np.maximum(next_ - prev, 1)
+
+    # The weights are float64; keep the caller's (float32) dtype
+    filled = np.where(bracketed, prev_value + weight * (next_value - prev_value), values).astype(values.dtype)
+    return filled, bracketed
+
+
+def seasonal_fill(values):
+    # Additive model for what interpolation can't reach: each cell's own
+    # mean plus the domain-wide anomaly of that day. All-NaN cells and days
+    # legitimately give NaN, so silence numpy's empty-slice warnings.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        cell_mean = np.nanmean(values, axis=0)
+        day_mean = np.nanmean(values, axis=1)
+        day_anomaly = np.nan_to_num(day_mean - np.nanmean(day_mean))
+
+    estimate = cell_mean[None, :] + day_anomaly[:, None]
+    missing = np.isnan(values) & ~np.isnan(estimate)
+    return np.where(missing, estimate, values).astype(values.dtype), missing
+
+
+def fill(values, max_gap, method='linear'):
+    filled, mask = interpolate_time(values, max_gap)
+    if method == 'seasonal':
+        filled, seasonal_mask = seasonal_fill(filled)
+        mask |= seasonal_mask
+    return filled, mask
+
+
+def bin_sif_to_cells(sif_df, cube, days, cell_lat, cell_lon):
+    # Mean SIF per (day, SMAP cell) from the scattered soundings
+    n_rows, n_cols = cube.shape[1:]
+    cell_rows, cell_cols = cube.nearest_cells(cell_lat, cell_lon)
+    cell_of = np.full(n_rows * n_cols, -1, dtype=np.int64)
+    cell_of[cell_rows * n_cols + cell_cols] = np.arange(len(cell_lat))
+
+    rows, cols = cube.nearest_cells(sif_df['latitude'].to_numpy(), sif_df['longitude'].to_numpy())
+    cell = cell_of[rows * n_cols + cols]
+    day = days.get_indexer(pd.to_datetime(sif_df['date']).dt.normalize())
+    keep = (cell >= 0) & (day >= 0)
+
+    flat = day[keep] * len(cell_lat) + cell[keep]
+    size = len(days) * len(cell_lat)
+    count = np.bincount(flat, minlength=size)
+    total = np.bincount(flat, weights=sif_df['sif'].to_numpy()[keep], minlength=size)
+    with np.errstate(invalid='ignore'):
+        return (total / count).astype(np.float32).reshape(len(days), len(cell_lat))
+
+
+def gap_filled_training_data(sif_file, cube_path, n_days=3, method='linear'):
+    cube = MoistureCube(cube_path)
+    days, cell_lat, cell_lon, moisture = cube.read_daily_cells()
+
+    # The day axis must be contiguous for lags and interpolation to line up
+    all_days = pd.date_range(days.min(), days.max(), freq='D')
+    day_index = all_days.get_indexer(days)
+    dense = {}
+    for variable, values in moisture.items():
+        dense[variable] = np.full((len(all_days), len(cell_lat)), np.nan, dtype=np.float32)
+        dense[variable][day_index] = values
+
+    sif = bin_sif_to_cells(read_parquet(sif_file), cube, all_days, cell_lat, cell_lon)
+
+    sif, sif_filled = fill(sif, MAX_SIF_GAP_DAYS, method)
+    surface, surface_filled = fill(dense['surface_soil_moisture'], MAX_MOISTURE_GAP_DAYS, method)
+    root, root_filled = fill(dense['root_zone_soil_moisture'], MAX_MOISTURE_GAP_DAYS, method)
+    print(f"Filled {sif_filled.sum()} SIF and {surface_filled.sum()} moisture values")
+
+    # Same layout as sif_moisture.parquet, plus a *_filled flag per value
+    frames = []
+    for t in range(n_days, len(all_days)):
+        frame = {
+            'date': all_days[t].strftime('%Y-%m-%d'),
+            'sif_lat': cell_lat,
+            'sif_lon': cell_lon,
+            'sif_value': sif[t],
+            'sif_filled': sif_filled[t],
+        }
+        for k in range(1, n_days + 1):
+            frame[f'water_prev{k}'] = surface[t - k]
+            frame[f'root_water_prev{k}'] = root[t - k]
+            frame[f'water_prev{k}_filled'] = surface_filled[t - k]
+            frame[f'root_water_prev{k}_filled'] = root_filled[t - k]
+        frame = pd.DataFrame(frame)
+        frames.append(frame[~np.isnan(sif[t])])
+
+    final_df = pd.concat(frames, ignore_index=True).dropna()
+    observed = (~final_df['sif_filled']).sum()
+    print(f"Built {len(final_df)} training rows ({observed} with observed SIF)")
+    return final_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gap-fill SIF and moisture over the SMAP grid.")
+    parser.add_argument('--method', choices=['linear', 'seasonal'], default='linear')
+    args = parser.parse_args()
+
+    final_df = gap_filled_training_data('oco3_sif.parquet', 'moisture_cube', n_days=3, method=args.method)
+    write_parquet(final_df, 'sif_moisture_filled.parquet')
@@ -0,0 +1,19 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def to_unit_vectors(lat, lon):
+    # Points on the unit sphere, so chord distance tracks great-circle distance
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def km_to_chord(distance_km):
+    return 2.0 * np.sin(distance_km / (2.0 * EARTH_RADIUS_KM))
+
+
+def chord_to_km(chord):
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
@@ -3,133 +3,122 @@ import numpy as np
 from scipy.spatial import cKDTree
 from datetime import timedelta
 
-def process_sif_moisture_data(sif_file, moisture_file, n_days=3):
+from geo import km_to_chord, to_unit_vectors
+from moisture_cube import MoistureCube
+from storage import read_parquet, write_parquet
+
+# Join on the sphere by default; the SMAP grid is 9 km, so anything further
+# than a couple of cells away is a gap in the data rather than a neighbour
+JOIN_MODE = 'haversine'
+MAX_DISTANCE_KM = 25.0
+
+
+def process_sif_moisture_data(sif_file, moisture_cube_path, n_days=3, join_mode=JOIN_MODE,
+                              max_distance_km=MAX_DISTANCE_KM, drop_na=True):
     # Load data
-    sif_df = pd.read_parquet(sif_file)
-    moisture_df = pd.read_parquet(moisture_file)
+    sif_df = read_parquet(sif_file)
+    cube = MoistureCube(moisture_cube_path)
 
-    # Convert 'date' columns to datetime
+    # Convert 'date' column to datetime
     sif_df['date'] = pd.to_datetime(sif_df['date']).dt.date
-    moisture_df['date'] = pd.to_datetime(moisture_df['date_time']).dt.date
 
-    # Sort dataframes by date
+    # Sort dataframe by date
     sif_df = sif_df.sort_values('date')
-    moisture_df = moisture_df.sort_values('date')
 
     # Get date ranges
     sif_start, sif_end = sif_df['date'].min(), sif_df['date'].max()
-    moisture_start, moisture_end = moisture_df['date'].min(), moisture_df['date'].max()
+    moisture_start, moisture_end = cube.times.min().date(), cube.times.max().date()
 
     print(f"SIF date range: {sif_start} to {sif_end}")
     print(f"Moisture date range: {moisture_start} to {moisture_end}")
 
-    # Filter moisture data to relevant date range
-    moisture_df = moisture_df[(moisture_df['date'] >= sif_start - timedelta(days=n_days)) &
-                              (moisture_df['date'] <= sif_end)]
-
-    # Group moisture data by date
-    moisture_groups = moisture_df.groupby('date')
-
-    # Build KDTree for each date in moisture data
+    # Build KDTree for each date, reading one day of the cube at a time
     moisture_KDTree_dict = {}
-    for date, group in moisture_groups:
-        lat_lons = group[['latitude', 'longitude']].values
-        tree = cKDTree(lat_lons)
+    for offset in range((sif_end - sif_start).days + n_days + 1):
+        date = sif_start - timedelta(days=n_days) + timedelta(days=offset)
+        group = cube.to_frame(start=date, end=date)
+        if group.empty:
+            continue
+
+        if join_mode == 'haversine':
+            points = to_unit_vectors(group['latitude'], group['longitude'])
+        else:
+            points = group[['latitude', 'longitude']].values
+        tree = cKDTree(points)
         moisture_KDTree_dict[date] = {
             'tree': tree,
             'moisture_values': group[['surface_soil_moisture', 'root_zone_soil_moisture']].values
         }
 
+    # A match further away than this is no match at all
+    distance_upper_bound = np.inf
+    if max_distance_km is not None:
+        if join_mode != 'haversine':
+            raise ValueError("max_distance_km needs join_mode='haversine', pass max_distance_km=None to join in degrees")
+        distance_upper_bound = km_to_chord(max_distance_km)
+
+    # Query every sounding of a day against each lag's tree in one batch
     results = []
-    for _, row in sif_df.iterrows():
-        sif_date = row['date']
-        sif_lat, sif_lon = row['latitude'], row['longitude']
-        
-        result_row = {
+    for sif_date, day in sif_df.groupby('date', sort=True):
+        result = pd.DataFrame({
             'date': sif_date,
-            'sif_lat': sif_lat,
-            'sif_lon': sif_lon,
-            'sif_value': row['sif']
-        }
+            'sif_lat': day['latitude'].to_numpy(),
+            'sif_lon': day['longitude'].to_numpy(),
+            'sif_value': day['sif'].to_numpy(),
+        })
+        if join_mode == 'haversine':
+            points = to_unit_vectors(day['latitude'], day['longitude'])
+        else:
+            points = day[['latitude', 'longitude']].values
 
         for k in range(1, n_days + 1):
             date_k = sif_date - timedelta(days=k)
             key = f'water_prev{k}'
             root_key = f'root_water_prev{k}'
-            
+            water = np.full(len(day), np.nan)
+            root_water = np.full(len(day), np.nan)
+            matched = np.zeros(len(day), dtype=bool)
+
             if date_k in moisture_KDTree_dict:
                 tree = moisture_KDTree_dict[date_k]['tree']
                 moisture_values = moisture_KDTree_dict[date_k]['moisture_values']
 
-                dist, idx_nn = tree.query([[sif_lat, sif_lon]], k=1)
-                moisture_value = moisture_values[idx_nn[0]]
-                
-                result_row[key] = moisture_value[0]
-                result_row[root_key] = moisture_value[1]
-            else:
-                result_row[key] = np.nan
-                result_row[root_key] = np.nan
-
-        results.append(result_row)
+                # Out-of-range neighbours come back with index == tree.n
+                _, idx_nn = tree.query(points, k=1, distance_upper_bound=distance_upper_bound, workers=-1)
+                matched = idx_nn < tree.n
+                water[matched] = moisture_values[idx_nn[matched], 0]
+                root_water[matched] = moisture_values[idx_nn[matched], 1]
 
-    final_df = pd.DataFrame(results)
-    initial_rows = len(final_df)
-    final_df = final_df.dropna()
-    rows_removed = initial_rows - len(final_df)
-    print(f"Removed {rows_removed} rows containing NA values.")
+            result[key] = water
+            result[root_key] = root_water
+            result[f'matched_prev{k}'] = matched
 
-    return final_df
+        results.append(result)
 
+    final_df = pd.concat(results, ignore_index=True)
+    matched_columns = [f'matched_prev{k}' for k in range(1, n_days + 1)]
+    unmatched = (~final_df[matched_columns].all(axis=1)).sum()
+    print(f"{unmatched} rows have at least one lag without a moisture match.")
 
-def create_dummy_inference_data(moisture_file, n_days=3):
-    # Load moisture data
-    moisture_df = pd.read_parquet(moisture_file)
-    
-    # Convert 'date' column to datetime
-    moisture_df['date'] = pd.to_datetime(moisture_df['date_time']).dt.date
-    
-    # Get the most recent date
-    most_recent_date = moisture_df['date'].max()
-    
-    # Filter data for the most recent date
-    recent_moisture = moisture_df[moisture_df['date'] == most_recent_date]
-    
-    # Create the dummy inference dataframe
-    dummy_inference = pd.DataFrame({
-        'date': recent_moisture['date'],
-        'sif_lat': recent_moisture['latitude'],
-        'sif_lon': recent_moisture['longitude'],
-        'sif_value': 0  # Fill with zeros as per requirement
-    })
-    
-    # Add moisture data columns
-    for i in range(1, n_days + 1):
-        dummy_inference[f'water_prev{i}'] = recent_moisture['surface_soil_moisture']
-        dummy_inference[f'root_water_prev{i}'] = recent_moisture['root_zone_soil_moisture']
-    
-    # Convert date to string for consistency with the main dataframe
-    dummy_inference['date'] = dummy_inference['date'].astype(str)
-    
-    print(f"Created dummy inference data with {len(dummy_inference)} rows for date {most_recent_date}")
-    print(dummy_inference.info())
-    
-    return dummy_inference
-
+    if drop_na:
+        initial_rows = len(final_df)
+        final_df = final_df.dropna().drop(columns=matched_columns)
+        rows_removed = initial_rows - len(final_df)
+        print(f"Removed {rows_removed} rows containing NA values.")
 
+    return final_df
 
 
 if __name__ == "__main__":
 
     sif_file = 'oco3_sif.parquet'
-    moisture_file = 'moisture.parquet'
+    moisture_cube_path = 'moisture_cube'
 
-    final_df = process_sif_moisture_data(sif_file, moisture_file, n_days=3)
+    # Unmatched rows are kept with their matched_prev* flags; consumers filter
+    final_df = process_sif_moisture_data(sif_file, moisture_cube_path, n_days=3, drop_na=False)
     final_df['date'] = final_df['date'].astype(str)
     print(final_df.info())
-    final_df.to_parquet('sif_moisture.parquet')
-
-    dummy_inference_df = create_dummy_inference_data(moisture_file, n_days=3)
+    write_parquet(final_df, 'sif_moisture.parquet')
 
-    # Save dummy inference data to parquet
-    dummy_inference_df.to_parquet('dummy_inference_data.parquet')
-    print("Dummy inference data saved to dummy_inference_data.parquet")
+    # One partition per day so training can pick up only the new days
+    write_parquet(final_df, 'sif_moisture_partitions', partition_cols=['date'])
@@ -0,0 +1,238 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from storage import read_parquet
+
+VARIABLES = ['surface_soil_moisture', 'root_zone_soil_moisture']
+
+# (time, row, col) chunk shape; a chunk of float32 is 512 KiB
+CHUNKS = (8, 128, 128)
+
+INDEX_FILE = 'index.json'
+LAND_FILE = 'land.npy'
+
+
+def _chunk_path(path, variable, t, r, c):
+    return os.path.join(path, variable, f'{t}.{r}.{c}.npy')
+
+
+def _is_date_only(value):
+    # SMAP L4 steps fall on the half hour, so a bound at midnight, whether a
+    # str, date, datetime64 or Timestamp, can only mean the whole day
+    timestamp = pd.Timestamp(value)
+    return timestamp == timestamp.normalize()
+
+
+def write_cube(moisture_df, path='moisture_cube', chunks=CHUNKS):
+    # The SMAP EASE-2 grid is separable: every row shares a latitude and
+    # every column shares a longitude, so coordinates are stored once
+    lat = np.unique(moisture_df['latitude'].to_numpy())[::-1]
+    lon = np.unique(moisture_df['longitude'].to_numpy())
+    times = pd.DatetimeIndex(np.unique(moisture_df['date_time'].to_numpy()))
+
+    rows = len(lat) - 1 - np.searchsorted(lat[::-1], moisture_df['latitude'].to_numpy())
+    cols = np.searchsorted(lon, moisture_df['longitude'].to_numpy())
+    steps = times.get_indexer(moisture_df['date_time'])
+
+    # Sort rows by time step once so each slab is a contiguous run
+    order = np.argsort(steps, kind='stable')
+    rows, cols, steps = rows[order], cols[order], steps[order]
+    bounds = np.searchsorted(steps, np.arange(0, len(times) + chunks[0], chunks[0]))
+
+    shape = (len(times), len(lat), len(lon))
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'lat.npy'), lat)
+    np.save(os.path.join(path, 'lon.npy'), lon)
+
+    # Cells with a value at any step; their order is the fixed cell numbering
+    land = np.zeros((len(lat), len(lon)), dtype=bool)
+    observed = ~np.isnan(moisture_df[VARIABLES[0]].to_numpy(dtype=np.float32))
+    land[rows[observed], cols[observed]] = True
+    np.save(os.path.join(path, LAND_FILE), land)
+
+    ct, cr, cc = chunks
+    for variable in VARIABLES:
+        os.makedirs(os.path.join(path, variable), exist_ok=True)
+        values = moisture_df[variable].to_numpy(dtype=np.float32)[order]
+
+        # Fill one slab of time steps at a time to keep memory bounded
+        for t in range(0, shape[0], ct):
+            in_slab = slice(bounds[t // ct], bounds[t // ct + 1])
+            slab = np.full((min(ct, shape[0] - t), shape[1], shape[2]), np.nan, dtype=np.float32)
+            slab[steps[in_slab] - t, rows[in_slab], cols[in_slab]] = values[in_slab]
+
+            for r in range(0, shape[1], cr):
+                for c in range(0, shape[2], cc):
+                    tile = slab[:, r:r + cr, c:c + cc]
+                    # Ocean and out-of-bbox tiles are skipped and read back as NaN
+                    if np.isnan(tile).all():
+                        continue
+                    np.save(_chunk_path(path, variable, t // ct, r // cr, c // cc), tile)
+
+    index = {
+        'variables': VARIABLES,
+        'shape': list(shape),
+        'chunks': list(chunks),
+        'dtype': 'float32',
+        'times': [time.isoformat() for time in times],
+    }
+    with open(os.path.join(path, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+
+    print(f"Wrote moisture cube {shape} to {path}")
+
+
+class MoistureCube:
+    def __init__(self, path='moisture_cube'):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        self.shape = tuple(self.index['shape'])
+        self.chunks = tuple(self.index['chunks'])
+        self.times = pd.DatetimeIndex(self.index['times'])
+        self.lat = np.load(os.path.join(path, 'lat.npy'), mmap_mode='r')
+        self.lon = np.load(os.path.join(path, 'lon.npy'), mmap_mode='r')
+        self._land = None
+
+    def time_slice(self, start=None, end=None):
+        start = 0 if start is None else self.times.searchsorted(pd.Timestamp(start), side='left')
+        if end is None:
+            end = len(self.times)
+        elif _is_date_only(end):
+            # Every 3-hourly step of the end day, not just its midnight step
+            end = self.times.searchsorted(pd.Timestamp(end).normalize() + pd.Timedelta(days=1), side='left')
+        else:
+            end = self.times.searchsorted(pd.Timestamp(end), side='right')
+        return slice(start, end)
+
+    def row_slice(self, lat_min=-90.0, lat_max=90.0):
+        # Latitudes are stored north to south
+        ascending = self.lat[::-1]
+        start = len(self.lat) - np.searchsorted(ascending, lat_max, side='right')
+        end = len(self.lat) - np.searchsorted(ascending, lat_min, side='left')
+        return slice(start, end)
+
+    def col_slice(self, lon_min=-180.0, lon_max=180.0):
+        return slice(np.searchsorted(self.lon, lon_min, side='left'),
+                     np.searchsorted(self.lon, lon_max, side='right'))
+
+    def read(self, variable, start=None, end=None,
+             lat_min=-90.0, lat_max=90.0, lon_min=-180.0, lon_max=180.0):
+        ts = self.time_slice(start, end)
+        rs = self.row_slice(lat_min, lat_max)
+        cs = self.col_slice(lon_min, lon_max)
+        out = np.full((ts.stop - ts.start, rs.stop - rs.start, cs.stop - cs.start), np.nan, dtype=np.float32)
+        if out.size == 0:
+            return self.times[ts], np.asarray(self.lat[rs]), np.asarray(self.lon[cs]), out
+
+        # Only the chunks overlapping the window are touched, each memory-mapped
+        ct, cr, cc = self.chunks
+        for t in range(ts.start // ct, (ts.stop - 1) // ct + 1):
+            for r in range(rs.start // cr, (rs.stop - 1) // cr + 1):
+                for c in range(cs.start // cc, (cs.stop - 1) // cc + 1):
+                    chunk_file = _chunk_path(self.path, variable, t, r, c)
+                    if not os.path.exists(chunk_file):
+                        continue
+                    chunk = np.load(chunk_file, mmap_mode='r')
+
+                    # Overlap between the window and this chunk, in cube coordinates
+                    t0, t1 = max(ts.start, t * ct), min(ts.stop, t * ct + chunk.shape[0])
+                    r0, r1 = max(rs.start, r * cr), min(rs.stop, r * cr + chunk.shape[1])
+                    c0, c1 = max(cs.start, c * cc), min(cs.stop, c * cc + chunk.shape[2])
+                    out[t0 - ts.start:t1 - ts.start, r0 - rs.start:r1 - rs.start, c0 - cs.start:c1 - cs.start] = \
+                        chunk[t0 - t * ct:t1 - t * ct, r0 - r * cr:r1 - r * cr, c0 - c * cc:c1 - c * cc]
+
+        return self.times[ts], np.asarray(self.lat[rs]), np.asarray(self.lon[cs]), out
+
+    def read_daily(self, variable, start=None, end=None, **window):
+        # Average the 3-hourly steps down to one grid per day
+        times, lat, lon, values = self.read(variable, start, end, **window)
+        days, day_codes = np.unique(times.normalize(), return_inverse=True)
+        daily = np.full((len(days),) + values.shape[1:], np.nan, dtype=np.float32)
+        for i in range(len(days)):
+            steps = values[day_codes == i]
+            valid = (~np.isnan(steps)).sum(axis=0)
+            total = np.nansum(steps, axis=0)
+            daily[i] = np.where(valid > 0, total / np.maximum(valid, 1), np.nan)
+        return pd.DatetimeIndex(days), lat, lon, daily
+
+    def read_daily_cells(self, start=None, end=None, **window):
+        # Daily (date x cell) arrays over land cells only, flattened row-major
+        arrays = {}
+        for variable in VARIABLES:
+            days, lat, lon, values = self.read_daily(variable, start, end, **window)
+            arrays[variable] = values.reshape(len(days), -1)
+
+        land = ~np.isnan(arrays[VARIABLES[0]]).all(axis=0)
+        cell_lat = np.repeat(lat, len(lon))[land]
+        cell_lon = np.tile(lon, len(lat))[land]
+        return days, cell_lat, cell_lon, {variable: values[:, land] for variable, values in arrays.items()}
+
+    def nearest_cells(self, lat, lon):
+        # Nearest (row, col) of the separable grid for arbitrary points
+        ascending = self.lat[::-1]
+        up = np.clip(np.searchsorted(ascending, lat), 1, len(ascending) - 1)
+        up -= (lat - ascending[up - 1]) < (ascending[up] - lat)
+        rows = len(self.lat) - 1 - up
+
+        right = np.clip(np.searchsorted(self.lon, lon), 1, len(self.lon) - 1)
+        right -= (lon - self.lon[right - 1]) < (self.lon[right] - lon)
+        return rows, right
+
+    def land_cells(self):
+        # Row-major flat index and centre of every cell with data at any step
+        if self._land is None:
+            land_path = os.path.join(self.path, LAND_FILE)
+            if os.path.exists(land_path):
+                land = np.load(land_path)
+            else:
+                # Cubes written before the land mask: derive it from the data
+                land = ~np.isnan(self.read(VARIABLES[0])[3]).all(axis=0)
+            flat = np.flatnonzero(land)
+            self._land = (flat, np.asarray(self.lat)[flat // len(self.lon)], np.asarray(self.lon)[flat % len(self.lon)])
+        return self._land
+
+    def cell_codes(self, lat, lon):
+        # Position in land_cells() of the land cell under each point; -1 for
+        # points over water or off the grid
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        flat, _, _ = self.land_cells()
+        cell_of = np.full(len(self.lat) * len(self.lon), -1, dtype=np.int32)
+        cell_of[flat] = np.arange(len(flat), dtype=np.int32)
+
+        rows, cols = self.nearest_cells(lat, lon)
+        codes = cell_of[rows * len(self.lon) + cols]
+
+        # nearest_cells clamps to the edge, so reject points beyond half a cell
+        lat_margin = np.abs(np.diff(self.lat)).max() / 2 if len(self.lat) > 1 else 0.0
+        lon_margin = np.abs(np.diff(self.lon)).max() / 2 if len(self.lon) > 1 else 0.0
+        on_grid = ((lat >= self.lat.min() - lat_margin) & (lat <= self.lat.max() + lat_margin) &
+                   (lon >= self.lon.min() - lon_margin) & (lon <= self.lon.max() + lon_margin))
+        codes[~on_grid] = -1
+        return codes
+
+    def to_frame(self, start=None, end=None, **window):
+        # Long format matching moisture.parquet, for code that still wants rows
+        columns = {}
+        for variable in VARIABLES:
+            times, lat, lon, values = self.read(variable, start, end, **window)
+            columns[variable] = values.ravel()
+
+        t, r, c = np.meshgrid(np.arange(len(times)), np.arange(len(lat)), np.arange(len(lon)), indexing='ij')
+        df = pd.DataFrame({
+            'date_time': times[t.ravel()],
+            'latitude': lat[r.ravel()],
+            'longitude': lon[c.ravel()],
+            **columns,
+        })
+        return df.dropna(subset=VARIABLES).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # Convert a moisture.parquet left over from before the cube
+    write_cube(read_parquet('moisture.parquet'))
@@ -5,6 +5,8 @@ import pandas as pd
 from glob import glob
 from datetime import datetime
 
+from moisture_cube import write_cube
+
 US_BBOX = {
     'min_lat': 24.396308,
     'max_lat': 49.384358,
@@ -53,7 +55,7 @@ def process_smap_l4_file(file_path):
 if __name__ == "__main__":
     # Process all files
 
-    if not os.path.exists("moisture.parquet"):
+    if not os.path.exists("moisture_cube"):
         data_path = "./data/moisture"
 
         all_files = sorted(glob(os.path.join(data_path, 'SMAP_L4_SM_gph_*.h5')))
@@ -63,7 +65,8 @@ if __name__ == "__main__":
         # Concatenate all data
         final_df = pd.concat(all_data, ignore_index=True)
 
-        # Save to parquet format
-        final_df.to_parquet('moisture.parquet')
+        # Chunked (time x row x col) cube for windowed, memory-mapped reads;
+        # it replaces moisture.parquet as the only stored copy
+        write_cube(final_df, 'moisture_cube')
         
         print(f"Processed data saved. Total rows: {len(final_df)}")
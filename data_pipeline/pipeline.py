@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Every path is relative to the repository root, where the scripts write
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_FILE = '.pipeline_state.json'
+
+# Stages and the files they read and write. Dependencies between stages
+# are inferred from these, so the SIF and moisture branches run side by side.
+STAGES = [
+    {
+        'name': 'get_data',
+        'script': 'data_pipeline/get_data.py',
+        'inputs': [],
+        'outputs': ['data/moisture', 'data/sif'],
+        # Never throw away downloaded granules, earthaccess skips existing files
+        'clean': False,
+    },
+    {
+        'name': 'sif_preprocess',
+        'script': 'data_pipeline/sif_preprocess.py',
+        'inputs': ['data/sif', 'data_pipeline/storage.py'],
+        'outputs': ['oco3_sif.parquet'],
+        'clean': True,
+    },
+    {
+        'name': 'moisture_preprocess',
+        'script': 'data_pipeline/moisture_preprocess.py',
+        'inputs': ['data/moisture', 'data_pipeline/moisture_cube.py', 'data_pipeline/storage.py'],
+        'outputs': ['moisture_cube'],
+        'clean': True,
+    },
+    {
+        'name': 'merge_data',
+        'script': 'data_pipeline/merge_data.py',
+        'inputs': ['oco3_sif.parquet', 'moisture_cube', 'data_pipeline/moisture_cube.py',
+                   'data_pipeline/geo.py', 'data_pipeline/storage.py'],
+        'outputs': ['sif_moisture.parquet', 'sif_moisture_partitions'],
+        'clean': True,
+    },
+    {
+        'name': 'gap_fill',
+        'script': 'data_pipeline/gap_fill.py',
+        'inputs': ['oco3_sif.parquet', 'moisture_cube', 'data_pipeline/moisture_cube.py', 'data_pipeline/storage.py'],
+        'outputs': ['sif_moisture_filled.parquet'],
+        'clean': True,
+    },
+    {
+        'name': 'feature_store',
+        'script': 'data_pipeline/feature_store.py',
+        'inputs': ['moisture_cube', 'data_pipeline/moisture_cube.py', 'data_pipeline/storage.py'],
+        'outputs': ['feature_store'],
+        'clean': True,
+    },
+]
+
+
+def file_digest(path, cache):
+    # Reuse the previous digest while size and mtime are unchanged
+    stat = os.stat(path)
+    key = f'{stat.st_size}:{stat.st_mtime_ns}'
+    cached = cache.get(path)
+    if cached and cached['key'] == key:
+        return cached['digest']
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    cache[path] = {'key': key, 'digest': sha.hexdigest()}
+    return cache[path]['digest']
+
+
+def content_hash(paths, cache):
+    sha = hashlib.sha256()
+    for path in paths:
+        full = os.path.join(ROOT, path)
+        if os.path.isdir(full):
+            for dirpath, dirnames, filenames in os.walk(full):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    file_path = os.path.join(dirpath, filename)
+                    sha.update(os.path.relpath(file_path, ROOT).encode())
+                    sha.update(file_digest(file_path, cache).encode())
+        elif os.path.exists(full):
+            sha.update(path.encode())
+            sha.update(file_digest(full, cache).encode())
+        else:
+            sha.update(f'{path}:missing'.encode())
+    return sha.hexdigest()
+
+
+def stage_dependencies(stages):
+    producers = {output: stage['name'] for stage in stages for output in stage['outputs']}
+    return {
+        stage['name']: {producers[path] for path in stage['inputs'] if path in producers}
+        for stage in stages
+    }
+
+
+def critical_path(stages, durations):
+    # Longest chain of dependent stages, by last recorded run time
+    deps = stage_dependencies(stages)
+    finish = {}
+    for stage in stages:
+        start = max((finish[dep] for dep in deps[stage['name']]), default=0.0)
+        finish[stage['name']] = start + durations.get(stage['name'], 0.0)
+    return max(finish.values(), default=0.0)
+
+
+def load_state():
+    path = os.path.join(ROOT, STATE_FILE)
+    if not os.path.exists(path):
+        return {'stages': {}, 'files': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state):
+    with open(os.path.join(ROOT, STATE_FILE), 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def is_up_to_date(stage, signature, state):
+    outputs_exist = all(os.path.exists(os.path.join(ROOT, path)) for path in stage['outputs'])
+    return outputs_exist and state['stages'].get(stage['name'], {}).get('signature') == signature
+
+
+def run_stage(stage):
+    if stage['clean']:
+        # The scripts skip work when their output exists, so drop stale outputs first
+        for path in stage['outputs']:
+            full = os.path.join(ROOT, path)
+            if os.path.isdir(full):
+                shutil.rmtree(full)
+            elif os.path.exists(full):
+                os.remove(full)
+
+    print(f"[{stage['name']}] running {stage['script']}")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, stage['script']], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    elapsed = time.perf_counter() - start
+
+    # Print the captured log in one block so parallel stages don't interleave
+    for line in result.stdout.splitlines():
+        print(f"[{stage['name']}] {line}")
+    if result.returncode != 0:
+        raise RuntimeError(f"Stage {stage['name']} failed with exit code {result.returncode}")
+
+    print(f"[{stage['name']}] finished in {elapsed:.1f}s")
+    return elapsed
+
+
+def run_pipeline(targets=None, force=False, jobs=None):
+    stages = {stage['name']: stage for stage in STAGES}
+    deps = stage_dependencies(STAGES)
+
+    # Restrict to the requested targets and everything upstream of them
+    wanted = set(targets or stages)
+    pending = list(wanted)
+    while pending:
+        for dep in deps[pending.pop()]:
+            if dep not in wanted:
+                wanted.add(dep)
+                pending.append(dep)
+
+    state = load_state()
+    done, rerun, running = set(), set(), {}
+
+    with ThreadPoolExecutor(max_workers=jobs or len(wanted) or 1) as pool:
+        while len(done) < len(wanted):
+            for name in wanted - done - set(running.values()):
+                if not deps[name] <= done:
+                    continue
+
+                stage = stages[name]
+                # Hashed when the stage becomes ready, so upstream outputs are final
+                signature = content_hash([stage['script']] + stage['inputs'], state['files'])
+                if not force and not (deps[name] & rerun) and is_up_to_date(stage, signature, state):
+                    print(f"[{name}] up to date, skipping")
+                    done.add(name)
+                    continue
+
+                running[pool.submit(run_stage, stage)] = name
+                state['stages'][name] = {'signature': signature}
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    state['stages'][name]['duration'] = future.result()
+                except Exception:
+                    # Forget the signature so the stage is retried next time
+                    del state['stages'][name]
+                    save_state(state)
+                    raise
+                done.add(name)
+                rerun.add(name)
+                save_state(state)
+
+    durations = {name: info.get('duration', 0.0) for name, info in state['stages'].items()}
+    print(f"Pipeline complete, critical path {critical_path(STAGES, durations):.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the root-access data pipeline.")
+    parser.add_argument('targets', nargs='*',
+                        help="Stages to build, along with their upstream stages (default: all)")
+    parser.add_argument('--force', action='store_true', help="Rerun stages even if they are up to date")
+    parser.add_argument('--jobs', type=int, default=None, help="Maximum number of stages run at once")
+    args = parser.parse_args()
+
+    unknown = set(args.targets) - {stage['name'] for stage in STAGES}
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    run_pipeline(args.targets, force=args.force, jobs=args.jobs)
@@ -5,6 +5,8 @@ import pandas as pd
 from glob import glob
 from datetime import datetime
 
+from storage import write_parquet
+
 US_BBOX = {
     'min_lat': 24.396308,
     'max_lat': 49.384358,
@@ -12,10 +14,21 @@ US_BBOX = {
     'max_lon': -66.93457
 }
 
+def read_raw(nc, name):
+    # Raw NumPy array plus a mask of its fill values (auto-masking is off)
+    variable = nc.variables[name]
+    values = variable[:]
+    fill_value = getattr(variable, '_FillValue', None)
+    valid = values > -1e30 if values.dtype.kind == 'f' else np.ones(values.shape, dtype=bool)
+    if fill_value is not None:
+        valid &= values != fill_value
+    return values, valid
+
+
 def process_oco3_sif_file(file_path):
     with netCDF4.Dataset(file_path, 'r') as nc:
-        # Print out all variable names
-        print("Available variables:", list(nc.variables.keys()))
+        # Skip building masked arrays, we mask everything in one pass below
+        nc.set_auto_mask(False)
 
         # Extract date from filename
         filename = os.path.basename(file_path)
@@ -24,33 +37,29 @@ def process_oco3_sif_file(file_path):
         print(f"Processing {date}...")
 
         # Read relevant datasets
-        latitude = nc.variables['Latitude'][:]
-        longitude = nc.variables['Longitude'][:]
-        sif = nc.variables['Daily_SIF_757nm'][:]  # Using Daily SIF at 757nm
-        sif_uncertainty = nc.variables['SIF_Uncertainty_740nm'][:]  # Using uncertainty at 740nm as a proxy
-        quality_flag = nc.variables['Quality_Flag'][:]
-
-        # Create DataFrame
-        df = pd.DataFrame({
-            'date': date,
-            'latitude': latitude,
-            'longitude': longitude,
-            'sif': sif,
-            'sif_uncertainty': sif_uncertainty,
-            'quality_flag': quality_flag
-        })
-
-        # Remove fill values (you may need to adjust this based on the actual fill value)
-        df = df[(df['sif'] > -1e30) & (df['sif_uncertainty'] > -1e30)]
-
-        # Filter for good quality data (adjust as needed based on the meaning of Quality_Flag)
-        df = df[df['quality_flag'] == 0]  # Assuming 0 means good quality
-
-        # Filter for USA
-        df = df[(df['latitude'] >= US_BBOX['min_lat']) & (df['latitude'] <= US_BBOX['max_lat']) &
-                (df['longitude'] >= US_BBOX['min_lon']) & (df['longitude'] <= US_BBOX['max_lon'])]
-
-        return df
+        latitude, latitude_valid = read_raw(nc, 'Latitude')
+        longitude, longitude_valid = read_raw(nc, 'Longitude')
+        sif, sif_valid = read_raw(nc, 'Daily_SIF_757nm')  # Using Daily SIF at 757nm
+        sif_uncertainty, sif_uncertainty_valid = read_raw(nc, 'SIF_Uncertainty_740nm')  # Using uncertainty at 740nm as a proxy
+        quality_flag, _ = read_raw(nc, 'Quality_Flag')
+
+    # Single combined mask: fill values, good quality (0) and inside the USA
+    keep = (latitude_valid & longitude_valid & sif_valid & sif_uncertainty_valid &
+            (quality_flag == 0) &
+            (latitude >= US_BBOX['min_lat']) & (latitude <= US_BBOX['max_lat']) &
+            (longitude >= US_BBOX['min_lon']) & (longitude <= US_BBOX['max_lon']))
+
+    # Build each column exactly once from the compressed arrays
+    df = pd.DataFrame({
+        'date': np.full(np.count_nonzero(keep), np.datetime64(date, 'ns')),
+        'latitude': latitude[keep],
+        'longitude': longitude[keep],
+        'sif': sif[keep],
+        'sif_uncertainty': sif_uncertainty[keep],
+        'quality_flag': quality_flag[keep],
+    }, copy=False)
+
+    return df
 
 if __name__ == "__main__":
 
@@ -67,7 +76,7 @@ if __name__ == "__main__":
         final_df = pd.concat(all_data, ignore_index=True)
 
         # Save to parquet format
-        final_df.to_parquet('oco3_sif.parquet')
+        write_parquet(final_df, 'oco3_sif.parquet')
         
         print(f"Processed data saved. Total rows: {len(final_df)}")
 
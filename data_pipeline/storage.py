@@ -0,0 +1,95 @@
+import json
+import os
+
+import pandas as pd
+
+# Defaults for every parquet file the pipeline writes. Override any of them
+# with a JSON file named by ROOT_ACCESS_PARQUET (see storage_benchmark.py).
+PARQUET_SETTINGS = {
+    'engine': 'pyarrow',
+    'compression': 'zstd',
+    'compression_level': 3,
+    'row_group_size': 256_000,
+    'use_dictionary': True,
+    'write_statistics': True,
+}
+
+
+def parquet_settings(**overrides):
+    settings = dict(PARQUET_SETTINGS)
+    config_path = os.environ.get('ROOT_ACCESS_PARQUET')
+    if config_path:
+        with open(config_path) as f:
+            settings.update(json.load(f))
+    settings.update(overrides)
+    return settings
+
+
+def write_parquet(df, path, partition_cols=None, **overrides):
+    # partition_cols writes a hive-partitioned directory instead of one file
+    settings = parquet_settings(**overrides)
+    engine = settings.pop('engine')
+
+    if engine == 'fastparquet':
+        # fastparquet names these differently and has no level/dictionary knobs
+        df.to_parquet(
+            path,
+            engine='fastparquet',
+            compression=settings['compression'],
+            row_group_offsets=settings['row_group_size'],
+            stats=settings['write_statistics'],
+            partition_cols=partition_cols,
+        )
+    elif partition_cols:
+        # pyarrow's dataset writer caps row groups with max_rows_per_group and
+        # replaces only the partitions present in df
+        row_group_size = settings.pop('row_group_size')
+        df.to_parquet(path, engine=engine, partition_cols=partition_cols,
+                      max_rows_per_group=row_group_size, existing_data_behavior='delete_matching',
+                      **settings)
+    else:
+        df.to_parquet(path, engine=engine, **settings)
+
+
+OPERATORS = {
+    '==': lambda column, value: column == value,
+    '=': lambda column, value: column == value,
+    '!=': lambda column, value: column != value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+    'in': lambda column, value: column.isin(value),
+    'not in': lambda column, value: ~column.isin(value),
+}
+
+
+def filter_mask(df, filters):
+    # Row mask for pyarrow-style filters: a list of (column, op, value) ANDed
+    # together, or a list of such lists ORed together
+    if filters and isinstance(filters[0], tuple):
+        filters = [filters]
+
+    mask = pd.Series(False, index=df.index)
+    for conjunction in filters:
+        keep = pd.Series(True, index=df.index)
+        for column, op, value in conjunction:
+            keep &= OPERATORS[op](df[column], value)
+        mask |= keep
+    return mask
+
+
+def read_parquet(path, columns=None, filters=None, **overrides):
+    # Same engine as the writer; filters are pushed down to row-group statistics
+    engine = parquet_settings(**overrides)['engine']
+    if engine != 'fastparquet' or not filters:
+        return pd.read_parquet(path, engine=engine, columns=columns, filters=filters)
+
+    # fastparquet only skips whole row groups, so drop the remaining
+    # non-matching rows here to return the same rows as pyarrow
+    filter_columns = {column for conjunction in ([filters] if isinstance(filters[0], tuple) else filters)
+                      for column, _, _ in conjunction}
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + sorted(filter_columns)))
+    df = pd.read_parquet(path, engine=engine, columns=read_columns, filters=filters)
+    df = df[filter_mask(df, filters)]
+    return df if columns is None else df[list(columns)]
@@ -0,0 +1,124 @@
+import argparse
+import itertools
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from storage import read_parquet, write_parquet
+
+DEFAULT_FILES = ['oco3_sif.parquet', 'sif_moisture.parquet']
+
+CODECS = [
+    ('snappy', None),
+    ('zstd', 1),
+    ('zstd', 3),
+    ('zstd', 9),
+    ('gzip', 6),
+    ('none', None),
+]
+ROW_GROUP_SIZES = [64_000, 256_000, 1_000_000]
+DICTIONARY = [True, False]
+
+# Half-width in degrees of the box used for the filtered read
+WINDOW_DEGREES = 2.5
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def window_filters(df):
+    # A typical map view: one day and a few degrees around the data's centre
+    lat = 'sif_lat' if 'sif_lat' in df else 'latitude'
+    lon = 'sif_lon' if 'sif_lon' in df else 'longitude'
+    date = 'date' if 'date' in df else 'date_time'
+
+    day = df[date].sort_values().iloc[len(df) // 2]
+    lat_mid, lon_mid = df[lat].median(), df[lon].median()
+    return [
+        (date, '==', day),
+        (lat, '>=', lat_mid - WINDOW_DEGREES), (lat, '<=', lat_mid + WINDOW_DEGREES),
+        (lon, '>=', lon_mid - WINDOW_DEGREES), (lon, '<=', lon_mid + WINDOW_DEGREES),
+    ]
+
+
+def candidates():
+    for (codec, level), row_group_size, dictionary in itertools.product(CODECS, ROW_GROUP_SIZES, DICTIONARY):
+        yield {
+            'engine': 'pyarrow',
+            'compression': None if codec == 'none' else codec,
+            'compression_level': level,
+            'row_group_size': row_group_size,
+            'use_dictionary': dictionary,
+            'write_statistics': True,
+        }
+
+    # fastparquet has no level or dictionary knobs, so only codec and row groups vary
+    codecs = list(dict.fromkeys(codec for codec, _ in CODECS))
+    for codec, row_group_size in itertools.product(codecs, ROW_GROUP_SIZES):
+        yield {
+            'engine': 'fastparquet',
+            'compression': None if codec == 'none' else codec,
+            'compression_level': None,
+            'row_group_size': row_group_size,
+            'use_dictionary': None,
+            'write_statistics': True,
+        }
+
+
+def benchmark_file(path, repeat=3):
+    df = read_parquet(path)
+    filters = window_filters(df)
+    print(f"Benchmarking {path}: {len(df)} rows, {df.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, settings in enumerate(candidates()):
+            out = os.path.join(tmp, f'{i}.parquet')
+            try:
+                write_time = best_of(repeat, lambda: write_parquet(df, out, **settings))
+                read_time = best_of(repeat, lambda: read_parquet(out, engine=settings['engine']))
+                filtered_time = best_of(repeat, lambda: read_parquet(out, filters=filters, engine=settings['engine']))
+            except (ImportError, ValueError, TypeError) as error:
+                print(f"Skipping {settings}: {error}")
+                continue
+
+            results.append({
+                'file': os.path.basename(path),
+                **settings,
+                'size_mb': os.path.getsize(out) / 1e6,
+                'write_s': write_time,
+                'read_s': read_time,
+                'filtered_read_s': filtered_time,
+            })
+            os.remove(out)
+
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare parquet writer settings on the pipeline's own files.")
+    parser.add_argument('files', nargs='*', default=DEFAULT_FILES, help="Parquet files to benchmark")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement, the best is kept")
+    parser.add_argument('--output', default='storage_benchmark.csv', help="Where to save the results")
+    args = parser.parse_args()
+
+    frames = [benchmark_file(path, args.repeat) for path in args.files if os.path.exists(path)]
+    if not frames:
+        raise SystemExit("None of the benchmark files exist, run `make data` first")
+
+    results = pd.concat(frames, ignore_index=True)
+    results.to_csv(args.output, index=False)
+
+    pd.set_option('display.width', 200)
+    for file, group in results.groupby('file'):
+        print(f"\n{file}")
+        print(group.sort_values('filtered_read_s').drop(columns='file').head(10).to_string(index=False))
+    print(f"\nFull results saved to {args.output}")
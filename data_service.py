@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import tempfile
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_pipeline'))
+from moisture_cube import MoistureCube
+from storage import read_parquet
+
+# Where the running service advertises its shared memory blocks
+MANIFEST = os.path.join(tempfile.gettempdir(), 'root_access_data_service.json')
+
+DATE_COLUMNS = ['date', 'date_time']
+LAT_COLUMNS = ['sif_lat', 'latitude']
+LON_COLUMNS = ['sif_lon', 'longitude']
+
+# Rows are binned onto this cube's SMAP land cells, whatever the dataset
+MOISTURE_CUBE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'moisture_cube')
+
+# Datasets the dashboards read, relative to the repository root
+DATASETS = [
+    'app/data/sif_moisture/sif_moisture.parquet',
+    'app/data/sif_moisture/sif_moisture_predicted.parquet',
+    'app/data/sif_moisture/sif_moisture_inpaint.parquet',
+    'app/data/sif_moisture/sif_moisture_filled.parquet',
+    'oco3_sif.parquet',
+]
+
+
+def dataset_key(path):
+    # Dashboards run from different directories, so key datasets by real path
+    return os.path.realpath(path)
+
+
+def file_version(path):
+    # Changes whenever the pipeline rewrites the file
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_columns(path):
+    df = read_parquet(path)
+    columns = {}
+    for column in df.columns:
+        if column in DATE_COLUMNS:
+            columns[column] = pd.to_datetime(df[column], errors='coerce').to_numpy(dtype='datetime64[ns]')
+        elif df[column].dtype.kind in 'biuf':
+            columns[column] = df[column].to_numpy()
+    return columns
+
+
+def build_index(columns):
+    # Integer cell and day code per row, plus the cells and days they point
+    # at. Built once per dataset, so every dashboard worker shares one copy.
+    index = {}
+    lat = next((columns[column] for column in LAT_COLUMNS if column in columns), None)
+    lon = next((columns[column] for column in LON_COLUMNS if column in columns), None)
+    if lat is not None and lon is not None and os.path.isdir(MOISTURE_CUBE):
+        # Fixed SMAP cells, so soundings and gridded rows share one numbering
+        cube = MoistureCube(MOISTURE_CUBE)
+        _, index['cell_lat'], index['cell_lon'] = cube.land_cells()
+        index['cell_code'] = cube.cell_codes(lat, lon)
+    elif lat is not None and lon is not None:
+        print(f"No moisture cube at {MOISTURE_CUBE}, using each distinct coordinate as a cell")
+        cell_codes, cells = pd.MultiIndex.from_arrays([lat, lon]).factorize()
+        index['cell_code'] = cell_codes.astype(np.int32)
+        index['cell_lat'] = cells.get_level_values(0).to_numpy()
+        index['cell_lon'] = cells.get_level_values(1).to_numpy()
+
+    if 'date' in columns:
+        days = pd.DatetimeIndex(columns['date']).normalize()
+        dates = pd.DatetimeIndex(np.unique(days.dropna()))
+        index['date_code'] = dates.get_indexer(days).astype(np.int32)
+        index['dates'] = dates.to_numpy(dtype='datetime64[ns]')
+    return index
+
+
+class LocalTable:
+    # Same interface as SharedTable, backed by this process's own copy
+    def __init__(self, path: str):
+        self.path = path
+        self.columns = load_columns(path)
+        self.index = build_index(self.columns)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def min(self, column: str):
+        return pd.Timestamp(self[column].min()) if self[column].dtype.kind == 'M' else self[column].min().item()
+
+    def max(self, column: str):
+        return pd.Timestamp(self[column].max()) if self[column].dtype.kind == 'M' else self[column].max().item()
+
+    def query(self, columns: list=None, equals: dict=None, between: dict=None) -> pd.DataFrame:
+        # Build one mask over the (read-only) columns, then copy just the matches
+        mask = np.ones(len(self), dtype=bool)
+        for column, value in (equals or {}).items():
+            mask &= self[column] == (np.datetime64(value) if self[column].dtype.kind == 'M' else value)
+        for column, (low, high) in (between or {}).items():
+            mask &= (self[column] >= low) & (self[column] <= high)
+
+        rows = np.flatnonzero(mask)
+        return pd.DataFrame({column: self[column][rows] for column in (columns or self.columns)})
+
+
+class SharedTable(LocalTable):
+    def __init__(self, path: str, entry: dict):
+        self.path = path
+        self.blocks = []
+        self.columns = {column: self._attach(spec) for column, spec in entry['columns'].items()}
+        self.index = {name: self._attach(spec) for name, spec in entry['index'].items()}
+
+    def _attach(self, spec: dict) -> np.ndarray:
+        # Attaching registers the block with this process's resource
+        # tracker, which would unlink it when we exit; only the service owns it
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=spec['shm'], track=False)
+        else:
+            block = shared_memory.SharedMemory(name=spec['shm'])
+            resource_tracker.unregister(block._name, 'shared_memory')
+        self.blocks.append(block)
+
+        array = np.ndarray((spec['length'],), dtype=np.dtype(spec['dtype']), buffer=block.buf)
+        array.flags.writeable = False
+        return array
+
+
+def open_table(path: str) -> LocalTable:
+    # Zero-copy views when the service is running, a private copy otherwise
+    if os.path.exists(MANIFEST):
+        with open(MANIFEST) as f:
+            manifest = json.load(f)
+        entry = manifest.get(dataset_key(path))
+        if entry is not None and entry.get('version') != file_version(path):
+            print(f"{path} changed since the data service loaded it, loading locally")
+        elif entry is not None:
+            try:
+                table = SharedTable(path, entry)
+                print(f"Attached to shared {path}")
+                return table
+            except (FileNotFoundError, KeyError):
+                print("Data service manifest is stale, loading locally")
+    return LocalTable(path)
+
+
+def share(values, blocks):
+    block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+    blocks.append(block)
+    return {'shm': block.name, 'dtype': values.dtype.str, 'length': len(values)}
+
+
+def serve(paths):
+    blocks, manifest = [], {}
+    try:
+        for path in paths:
+            if not os.path.exists(path):
+                print(f"Skipping missing {path}")
+                continue
+
+            # Taken before reading, so a rewrite during the load reads as stale
+            version = file_version(path)
+            columns = load_columns(path)
+            entry = {
+                'version': version,
+                'rows': len(next(iter(columns.values()), ())),
+                'columns': {column: share(values, blocks) for column, values in columns.items()},
+                'index': {name: share(values, blocks) for name, values in build_index(columns).items()},
+            }
+
+            manifest[dataset_key(path)] = entry
+            print(f"Serving {path}: {entry['rows']} rows, {len(columns)} columns")
+
+        with open(MANIFEST, 'w') as f:
+            json.dump(manifest, f)
+        print(f"Data service ready, manifest at {MANIFEST}")
+
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(MANIFEST):
+            os.remove(MANIFEST)
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share root-access datasets across dashboard processes.")
+    parser.add_argument('paths', nargs='*', default=DATASETS, help="Parquet files to load (default: all dashboards' data)")
+    args = parser.parse_args()
+
+    serve(args.paths)
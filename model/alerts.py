@@ -0,0 +1,166 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# Days of predicted SIF kept per cell for trend checks
+WINDOW = 7
+# Predicted SIF below this is flagged outright
+SIF_THRESHOLD = 0.2
+# Flag a day this many standard deviations below the cell's baseline...
+Z_THRESHOLD = 2.5
+# ...once the baseline has at least this many days behind it
+MIN_BASELINE_DAYS = 5
+# Floor on the baseline std, absolute and relative to the cell's mean, so a
+# cell that has held perfectly steady still flags a sudden drop
+MIN_STD = 0.01
+MIN_STD_FRACTION = 0.05
+# Flag a least-squares SIF slope (per day) over the window below this
+TREND_THRESHOLD = -0.05
+MIN_TREND_DAYS = 4
+
+
+class AlertEngine:
+    def __init__(self, state_path: str='alert_state.npz', sink_path: str='alerts.sqlite'):
+        self.state_path = state_path
+        self.sink_path = sink_path
+
+        if os.path.exists(state_path):
+            state = np.load(state_path)
+            self.cell_lat = state['cell_lat']
+            self.cell_lon = state['cell_lon']
+            self.history = state['history']
+            self.head = int(state['head'])
+            self.count = state['count']
+            self.mean = state['mean']
+            self.m2 = state['m2']
+            self.last_date = pd.Timestamp(str(state['last_date'])) if state['last_date'] else None
+        else:
+            self.cell_lat = np.empty(0)
+            self.cell_lon = np.empty(0)
+            self.history = np.empty((0, WINDOW), dtype=np.float32)
+            self.head = 0
+            self.count = np.empty(0, dtype=np.int32)
+            self.mean = np.empty(0)
+            self.m2 = np.empty(0)
+            self.last_date = None
+
+        self.cells = pd.MultiIndex.from_arrays([self.cell_lat, self.cell_lon])
+
+    def save(self):
+        # Write beside the old state and swap, so a crash never leaves half a file
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                cell_lat=self.cell_lat,
+                cell_lon=self.cell_lon,
+                history=self.history,
+                head=self.head,
+                count=self.count,
+                mean=self.mean,
+                m2=self.m2,
+                last_date=self.last_date.isoformat() if self.last_date is not None else '',
+            )
+        os.replace(tmp_path, self.state_path)
+
+    def _cell_index(self, lat, lon):
+        idx = self.cells.get_indexer(pd.MultiIndex.from_arrays([lat, lon]))
+
+        # Grow the store for cells we haven't seen before
+        new = idx < 0
+        if new.any():
+            n_new = int(new.sum())
+            idx[new] = np.arange(len(self.cell_lat), len(self.cell_lat) + n_new)
+            self.cell_lat = np.concatenate((self.cell_lat, lat[new]))
+            self.cell_lon = np.concatenate((self.cell_lon, lon[new]))
+            self.history = np.vstack((self.history, np.full((n_new, WINDOW), np.nan, dtype=np.float32)))
+            self.count = np.concatenate((self.count, np.zeros(n_new, dtype=np.int32)))
+            self.mean = np.concatenate((self.mean, np.zeros(n_new)))
+            self.m2 = np.concatenate((self.m2, np.zeros(n_new)))
+            self.cells = pd.MultiIndex.from_arrays([self.cell_lat, self.cell_lon])
+
+        return idx
+
+    def update(self, day_df: pd.DataFrame) -> pd.DataFrame:
+        # One day of predictions: date, sif_lat, sif_lon, sif_value
+        date = pd.Timestamp(day_df['date'].iloc[0]).normalize()
+        if self.last_date is not None and date <= self.last_date:
+            print(f"Alerts already computed for {date.date()}, skipping")
+            return pd.DataFrame()
+
+        lat = day_df['sif_lat'].to_numpy(dtype=np.float64)
+        lon = day_df['sif_lon'].to_numpy(dtype=np.float64)
+        value = day_df['sif_value'].to_numpy(dtype=np.float64)
+        idx = self._cell_index(lat, lon)
+
+        # Advance the shared ring buffer by the days since the last update, so
+        # skipped days stay NaN; cells without a value today get NaN as well
+        gap = 1 if self.last_date is None else (date - self.last_date).days
+        self.history[:, (self.head + np.arange(min(gap, WINDOW))) % WINDOW] = np.nan
+        self.head = (self.head + gap - 1) % WINDOW
+        self.history[idx, self.head] = value
+        self.head = (self.head + 1) % WINDOW
+
+        # Threshold: absolute floor, or far below the cell's own baseline
+        std = np.sqrt(self.m2[idx] / np.maximum(self.count[idx] - 1, 1))
+        std = np.maximum(std, np.maximum(MIN_STD, MIN_STD_FRACTION * np.abs(self.mean[idx])))
+        z = (value - self.mean[idx]) / std
+        has_baseline = self.count[idx] >= MIN_BASELINE_DAYS
+        below_floor = value < SIF_THRESHOLD
+        below_baseline = has_baseline & (z < -Z_THRESHOLD)
+
+        # Trend break: least-squares slope over the window, oldest first
+        window = np.roll(self.history[idx], -self.head, axis=1).astype(np.float64)
+        valid = ~np.isnan(window)
+        n_valid = valid.sum(axis=1)
+        x = np.broadcast_to(np.arange(WINDOW, dtype=np.float64), window.shape)
+        x_mean = (x * valid).sum(axis=1) / np.maximum(n_valid, 1)
+        y_mean = np.nansum(window, axis=1) / np.maximum(n_valid, 1)
+        dx = np.where(valid, x - x_mean[:, None], 0.0)
+        dy = np.where(valid, window - y_mean[:, None], 0.0)
+        denominator = (dx * dx).sum(axis=1)
+        slope = np.where(denominator > 0, (dx * dy).sum(axis=1) / np.where(denominator > 0, denominator, 1.0), 0.0)
+        trend_break = (n_valid >= MIN_TREND_DAYS) & (slope < TREND_THRESHOLD)
+
+        # Fold today into the baseline after checking against it (Welford)
+        self.count[idx] += 1
+        delta = value - self.mean[idx]
+        self.mean[idx] += delta / self.count[idx]
+        self.m2[idx] += delta * (value - self.mean[idx])
+        self.last_date = date
+
+        alerts = pd.concat([
+            pd.DataFrame({'kind': 'below_threshold', 'sif_lat': lat[below_floor],
+                          'sif_lon': lon[below_floor], 'sif_value': value[below_floor],
+                          'score': value[below_floor]}),
+            pd.DataFrame({'kind': 'below_baseline', 'sif_lat': lat[below_baseline],
+                          'sif_lon': lon[below_baseline], 'sif_value': value[below_baseline],
+                          'score': z[below_baseline]}),
+            pd.DataFrame({'kind': 'trend_break', 'sif_lat': lat[trend_break],
+                          'sif_lon': lon[trend_break], 'sif_value': value[trend_break],
+                          'score': slope[trend_break]}),
+        ], ignore_index=True)
+        alerts.insert(0, 'date', date.strftime('%Y-%m-%d'))
+
+        # Alerts first, then state: a crash in between replays this day, and
+        # emit replaces the day's rows rather than adding duplicates
+        self.emit(date.strftime('%Y-%m-%d'), alerts)
+        self.save()
+        print(f"{date.date()}: {len(alerts)} alerts over {len(idx)} cells")
+        return alerts
+
+    def emit(self, date: str, alerts: pd.DataFrame):
+        # One transaction per day, committed when the block exits
+        with sqlite3.connect(self.sink_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                "date TEXT, kind TEXT, sif_lat REAL, sif_lon REAL, sif_value REAL, score REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS alerts_date ON alerts (date)")
+            conn.execute("DELETE FROM alerts WHERE date = ?", (date,))
+            conn.executemany(
+                "INSERT INTO alerts (date, kind, sif_lat, sif_lon, sif_value, score) VALUES (?, ?, ?, ?, ?, ?)",
+                alerts[['date', 'kind', 'sif_lat', 'sif_lon', 'sif_value', 'score']].itertuples(index=False),
+            )
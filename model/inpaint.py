@@ -0,0 +1,167 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_pipeline'))
+from geo import chord_to_km, km_to_chord, to_unit_vectors
+from moisture_cube import MoistureCube
+from storage import read_parquet
+
+# Observations further than this from a grid cell don't influence it
+INPAINT_RADIUS_KM = 50.0
+# Number of nearby OCO-3 soundings blended into each grid cell
+INPAINT_NEIGHBOURS = 8
+# Inverse-distance weighting power
+IDW_POWER = 2.0
+# Grid cells processed per KD-tree query / prediction batch
+CHUNK_SIZE = 200_000
+MAX_WORKERS = os.cpu_count() or 1
+
+
+def daily_grid_from_frame(moisture_df):
+    # Average the 3-hourly SMAP granules down to one value per cell per day
+    moisture_df = moisture_df.copy()
+    moisture_df['date'] = pd.to_datetime(moisture_df['date_time']).dt.normalize()
+    daily = (moisture_df
+             .groupby(['date', 'latitude', 'longitude'], sort=False)
+             [['surface_soil_moisture', 'root_zone_soil_moisture']]
+             .mean()
+             .reset_index())
+
+    # Give every SMAP cell and every day an integer index
+    cell_codes, cells = pd.MultiIndex.from_arrays(
+        [daily['latitude'], daily['longitude']]).factorize()
+    dates = pd.DatetimeIndex(sorted(daily['date'].unique()))
+    date_codes = dates.get_indexer(daily['date'])
+
+    # Dense (date x cell) arrays, NaN where SMAP has no value
+    surface = np.full((len(dates), len(cells)), np.nan, dtype=np.float32)
+    root = np.full((len(dates), len(cells)), np.nan, dtype=np.float32)
+    surface[date_codes, cell_codes] = daily['surface_soil_moisture'].to_numpy()
+    root[date_codes, cell_codes] = daily['root_zone_soil_moisture'].to_numpy()
+
+    return dates, cells.get_level_values(0).to_numpy(), cells.get_level_values(1).to_numpy(), surface, root
+
+
+def daily_grid_from_cube(cube):
+    # Same (date x cell) layout as daily_grid_from_frame, sliced from the cube
+    dates, cell_lat, cell_lon, arrays = cube.read_daily_cells()
+    return dates, cell_lat, cell_lon, arrays['surface_soil_moisture'], arrays['root_zone_soil_moisture']
+
+
+def build_grid_features(moisture, n_days=3):
+    if isinstance(moisture, pd.DataFrame):
+        dates, cell_lat, cell_lon, surface, root = daily_grid_from_frame(moisture)
+    else:
+        dates, cell_lat, cell_lon, surface, root = daily_grid_from_cube(moisture)
+
+    # Build lag features for every day whose previous n_days are on disk
+    frames = []
+    for date in dates:
+        lag_idx = dates.get_indexer([date - pd.Timedelta(days=k) for k in range(1, n_days + 1)])
+        if (lag_idx < 0).any():
+            continue
+
+        frame = {
+            'date': np.full(len(cell_lat), date),
+            'sif_lat': cell_lat,
+            'sif_lon': cell_lon,
+        }
+        for k, idx in enumerate(lag_idx, start=1):
+            frame[f'water_prev{k}'] = surface[idx]
+            frame[f'root_water_prev{k}'] = root[idx]
+        frames.append(pd.DataFrame(frame))
+
+    if not frames:
+        raise ValueError(f"Need at least {n_days + 1} consecutive days of moisture data to inpaint")
+
+    grid_df = pd.concat(frames, ignore_index=True).dropna()
+    print(f"Built {len(grid_df)} grid feature rows over {grid_df['date'].nunique()} days")
+    return grid_df
+
+
+def predict_in_chunks(predict_fn, X):
+    # Score contiguous chunks on a thread pool; sklearn/numpy release the GIL
+    if len(X) == 0:
+        return np.empty(0)
+
+    starts = range(0, len(X), CHUNK_SIZE)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        chunks = list(pool.map(lambda start: predict_fn(X.iloc[start:start + CHUNK_SIZE]), starts))
+    return np.concatenate([np.asarray(chunk, dtype=np.float64) for chunk in chunks])
+
+
+def blend_observations(grid_xyz, grid_pred, obs_xyz, obs_sif):
+    # Nothing observed today: the prediction is the best we have
+    if len(obs_xyz) == 0:
+        return grid_pred.copy(), np.zeros(len(grid_pred), dtype=np.int32)
+
+    # Residual of each sounding against the prediction of its nearest cell
+    grid_tree = cKDTree(grid_xyz)
+    _, nearest_cell = grid_tree.query(obs_xyz, k=1, workers=-1)
+    residuals = obs_sif - grid_pred[nearest_cell]
+
+    obs_tree = cKDTree(obs_xyz)
+    k = min(INPAINT_NEIGHBOURS, len(obs_xyz))
+    radius = km_to_chord(INPAINT_RADIUS_KM)
+
+    # Kriging-lite: a nugget weight at the search radius shrinks the
+    # correction back toward the model prediction as soundings get sparse
+    nugget = INPAINT_RADIUS_KM ** -IDW_POWER
+    # Clamp distances so a sounding sitting on a cell centre doesn't blow up
+    min_km = 1.0
+
+    sif = np.empty(len(grid_pred), dtype=np.float64)
+    support = np.empty(len(grid_pred), dtype=np.int32)
+    for start in range(0, len(grid_xyz), CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        dist, idx = obs_tree.query(grid_xyz[start:stop], k=k, distance_upper_bound=radius, workers=-1)
+        dist = dist.reshape(len(dist), -1)
+        idx = idx.reshape(len(idx), -1)
+
+        # Missing neighbours come back as inf distance and index == n
+        found = np.isfinite(dist)
+        dist_km = np.maximum(chord_to_km(np.where(found, dist, 0.0)), min_km)
+        weights = np.where(found, dist_km ** -IDW_POWER, 0.0)
+        neighbour_residuals = residuals[np.where(found, idx, 0)]
+
+        correction = (weights * neighbour_residuals).sum(axis=1) / (weights.sum(axis=1) + nugget)
+        sif[start:stop] = grid_pred[start:stop] + correction
+        support[start:stop] = found.sum(axis=1)
+
+    return sif, support
+
+
+def inpaint_sif(predict_fn, features, moisture_file, sif_file, n_days=3):
+    # Prefer the chunked moisture cube when the pipeline has built one
+    if os.path.isdir(moisture_file):
+        moisture = MoistureCube(moisture_file)
+    else:
+        moisture = read_parquet(moisture_file)
+    grid_df = build_grid_features(moisture, n_days=n_days)
+    grid_df['sif_predicted'] = predict_in_chunks(predict_fn, grid_df[features])
+
+    sif_df = read_parquet(sif_file, columns=['date', 'latitude', 'longitude', 'sif'])
+    sif_df['date'] = pd.to_datetime(sif_df['date']).dt.normalize()
+    obs_groups = {date: group for date, group in sif_df.groupby('date')}
+
+    # Blend each day's predictions with that day's soundings
+    frames = []
+    for date, day in grid_df.groupby('date', sort=True):
+        obs = obs_groups.get(date, sif_df.iloc[:0])
+        sif, support = blend_observations(
+            to_unit_vectors(day['sif_lat'], day['sif_lon']),
+            day['sif_predicted'].to_numpy(),
+            to_unit_vectors(obs['latitude'], obs['longitude']),
+            obs['sif'].to_numpy(dtype=np.float64),
+        )
+        day = day.assign(sif_value=sif, n_observations=support)
+        frames.append(day)
+        print(f"Inpainted {date.date()}: {len(day)} cells, {len(obs)} soundings")
+
+    return pd.concat(frames, ignore_index=True)
+
@@ -1,4 +1,7 @@
+import hashlib
+import json
 import os
+import sys
 
 import pandas as pd
 import numpy as np
@@ -8,12 +11,27 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
 import joblib
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_pipeline'))
+from alerts import AlertEngine
+from inpaint import inpaint_sif
+from storage import read_parquet, write_parquet
+
+FEATURES = ['water_prev1', 'root_water_prev1', 'water_prev2',
+            'root_water_prev2', 'water_prev3', 'root_water_prev3']
+
 
 def load_formatted_sif_moisture_data(file_path='sif_moisture.parquet'):
-    df = pd.read_parquet(file_path)
+    df = read_parquet(file_path)
     df['date'] = pd.to_datetime(df['date'])
     df = df.sort_values('date')
 
+    # Unmatched soundings stay in the file, flagged by matched_prev*; the
+    # model needs every lag, so skip them here
+    complete = df[FEATURES + ['sif_value']].notna().all(axis=1)
+    if not complete.all():
+        print(f"Skipping {(~complete).sum()} rows without a moisture match for every lag.")
+        df = df[complete]
+
     # Print info about the loaded data
     print(f"Loaded {len(df)} rows of data.")
     print(f"Date range: {df['date'].min().date()} to {df['date'].max().date()}")
@@ -26,8 +44,13 @@ def load_formatted_sif_moisture_data(file_path='sif_moisture.parquet'):
 def linear_fit(df):
     # features = ['sif_lat', 'sif_lon', 'water_prev1', 'root_water_prev1', 'water_prev2',
     #             'root_water_prev2', 'water_prev3', 'root_water_prev3']
-    features = ['water_prev1', 'root_water_prev1', 'water_prev2',
-                'root_water_prev2', 'water_prev3', 'root_water_prev3']
+    features = FEATURES
+
+    # Gap-filled targets are interpolations, not observations; only learn from
+    # days OCO-3 actually saw (the filled moisture features are kept)
+    if 'sif_filled' in df:
+        df = df[~df['sif_filled'].astype(bool)]
+        print(f"Training on {len(df)} rows with an observed sif_value")
 
     X = df[features]
     y = df['sif_value']
@@ -55,24 +78,46 @@ def linear_fit(df):
     return model
 
 
+def data_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
 class ModelWrapper:
-    def __init__(self, fit_fn: callable):
+    def __init__(self, fit_fn: callable, data_path: str='sif_moisture.parquet'):
         self.fit_fn = fit_fn
+        self.data_path = data_path
         self.model_name = fit_fn.__name__
+        self.data_digest = data_digest(data_path)
 
-        if os.path.exists(f"{self.model_name}.joblib"):
+        # A saved model is reused only if it was fit on this exact data file
+        if os.path.exists(f"{self.model_name}.joblib") and self.saved_source() == self.source():
             print(f"Loading model from {self.model_name}.joblib")
             self.model = joblib.load(f"{self.model_name}.joblib")
         else:
-            print(f"Fitting model {self.model_name}")
+            print(f"Fitting model {self.model_name} on {self.data_path}")
             self.fit()
 
+    def source(self) -> dict:
+        return {'data_path': self.data_path, 'data_digest': self.data_digest}
+
+    def saved_source(self):
+        if not os.path.exists(f"{self.model_name}.source.json"):
+            return None
+        with open(f"{self.model_name}.source.json") as f:
+            return json.load(f)
+
     def fit(self):
-        df = load_formatted_sif_moisture_data()
+        df = load_formatted_sif_moisture_data(self.data_path)
         self.model = self.fit_fn(df)
 
     def save(self):
         joblib.dump(self.model, f"{self.model_name}.joblib")
+        with open(f"{self.model_name}.source.json", 'w') as f:
+            json.dump(self.source(), f)
 
     def load(self, path:str):
         self.model = joblib.load(path)
@@ -85,30 +130,36 @@ class ModelWrapper:
 if __name__ == "__main__":
 
 
-    model = ModelWrapper(linear_fit)
+    # train on the gap-filled data when the pipeline has produced it
+    training_file = 'sif_moisture_filled.parquet'
+    if not os.path.exists(training_file):
+        training_file = 'sif_moisture.parquet'
+
+    model = ModelWrapper(linear_fit, data_path=training_file)
     model.save()
 
     # perform inference on whole df
-    df = load_formatted_sif_moisture_data()
+    df = load_formatted_sif_moisture_data(training_file)
 
 
     # perform inference on the whole dataframe
     print("Performing inference on the whole dataframe...")
-    X = df[['water_prev1', 'root_water_prev1', 'water_prev2',
-            'root_water_prev2', 'water_prev3', 'root_water_prev3']]
+    X = df[FEATURES]
     y = df['sif_value']
     y_pred = model.predict(X)
     # substitute the predicted values in the dataframe
     df['sif_value'] = y_pred
     # save the dataframe with the predicted values
-    df.to_parquet('sif_moisture_predicted.parquet')
-
-    # perform inference on dummy_inference_data.parquet
-    print("Performing inference on dummy_inference_data.parquet...")
-    dummy_inference = pd.read_parquet('dummy_inference_data.parquet')
-    X = dummy_inference[['water_prev1', 'root_water_prev1', 'water_prev2',
-                         'root_water_prev2', 'water_prev3', 'root_water_prev3']]
-    y_pred = model.predict(X)
-    dummy_inference['sif_value'] = y_pred
-    dummy_inference.to_parquet('sif_moisture_inpaint.parquet')
-
+    write_parquet(df, 'sif_moisture_predicted.parquet')
+
+    # inpaint predicted SIF onto the full SMAP grid, blended with OCO-3 soundings
+    print("Inpainting predicted SIF onto the SMAP grid...")
+    inpainted_df = inpaint_sif(model.predict, FEATURES, 'moisture_cube', 'oco3_sif.parquet')
+    write_parquet(inpainted_df, 'sif_moisture_inpaint.parquet')
+
+    # flag stressed cells; days already folded into the alert state are skipped,
+    # and the state is saved after every day
+    print("Checking new predictions for stress alerts...")
+    alert_engine = AlertEngine()
+    for _, day in inpainted_df.groupby('date', sort=True):
+        alert_engine.update(day)
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import sys
+from glob import glob
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from model import FEATURES
+
+TARGET = 'sif_value'
+BATCH_SIZE = 100_000
+
+# Rows whose key hashes into the bottom TEST_FRACTION are held out. The
+# split depends only on the row itself, so it is stable across refits.
+TEST_FRACTION = 0.2
+SPLIT_KEYS = ['date', 'sif_lat', 'sif_lon']
+
+# Small ridge term keeps the normal equations solvable on tiny batches
+RIDGE = 1e-8
+
+
+def hash_split(df):
+    keys = df[SPLIT_KEYS].astype(str)
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return (hashes % 10_000) < TEST_FRACTION * 10_000
+
+
+class SufficientStats:
+    # Running X^T X, X^T y and y^T y with an intercept column prepended
+    def __init__(self, n_features):
+        self.xtx = np.zeros((n_features + 1, n_features + 1))
+        self.xty = np.zeros(n_features + 1)
+        self.yty = 0.0
+        self.n = 0
+
+    def update(self, X, y):
+        X = np.column_stack((np.ones(len(X)), X))
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        self.yty += float(y @ y)
+        self.n += len(y)
+
+    def add(self, other):
+        self.xtx += other.xtx
+        self.xty += other.xty
+        self.yty += other.yty
+        self.n += other.n
+
+    def subtract(self, other):
+        self.xtx -= other.xtx
+        self.xty -= other.xty
+        self.yty -= other.yty
+        self.n -= other.n
+
+    def sse(self, beta):
+        # Sum of squared errors of beta, without the rows themselves
+        return self.yty - 2.0 * beta @ self.xty + beta @ self.xtx @ beta
+
+    def sst(self):
+        return self.yty - self.xty[0] ** 2 / self.n
+
+
+class StreamingLinearRegression:
+    def __init__(self, features=FEATURES):
+        self.features = list(features)
+        self.train = SufficientStats(len(self.features))
+        self.test = SufficientStats(len(self.features))
+        # Per-day stats and the digest of the data they came from, so a day
+        # whose rows change can be swapped out of the totals
+        self.days = {}
+        self.coef_ = np.zeros(len(self.features))
+        self.intercept_ = 0.0
+
+    def day_stats(self):
+        return SufficientStats(len(self.features)), SufficientStats(len(self.features))
+
+    def accumulate(self, df, train_stats, test_stats):
+        X = df[self.features].to_numpy(dtype=np.float64)
+        y = df[TARGET].to_numpy(dtype=np.float64)
+        is_test = hash_split(df)
+
+        # Soundings without a moisture match for every lag are kept in the
+        # data (see matched_prev*) but can't be fit
+        complete = ~np.isnan(X).any(axis=1) & ~np.isnan(y)
+        train, test = complete & ~is_test, complete & is_test
+        train_stats.update(X[train], y[train])
+        test_stats.update(X[test], y[test])
+
+    def set_day(self, date, digest, train_stats, test_stats):
+        # Replace the day's previous contribution, if any, with the new one
+        self.drop_day(date)
+        self.train.add(train_stats)
+        self.test.add(test_stats)
+        self.days[date] = {'digest': digest, 'train': train_stats, 'test': test_stats}
+
+    def drop_day(self, date):
+        old = self.days.pop(date, None)
+        if old is not None:
+            self.train.subtract(old['train'])
+            self.test.subtract(old['test'])
+
+    def solve(self):
+        xtx = self.train.xtx + RIDGE * np.eye(len(self.train.xtx))
+        beta = np.linalg.solve(xtx, self.train.xty)
+        self.intercept_, self.coef_ = beta[0], beta[1:]
+        return self
+
+    def predict(self, X):
+        return np.asarray(X, dtype=np.float64) @ self.coef_ + self.intercept_
+
+    def score(self):
+        beta = np.concatenate(([self.intercept_], self.coef_))
+        mse = self.test.sse(beta) / self.test.n
+        r2 = 1.0 - self.test.sse(beta) / self.test.sst()
+        return mse, r2
+
+
+def list_partitions(path):
+    # A hive-partitioned directory (date=YYYY-MM-DD/...) or a single parquet file
+    if os.path.isdir(path):
+        return {
+            os.path.basename(partition).split('=', 1)[1]: sorted(glob(os.path.join(partition, '*.parquet')))
+            for partition in sorted(glob(os.path.join(path, 'date=*')))
+        }
+    return {None: [path]}
+
+
+def partition_digest(files):
+    sha = hashlib.sha256()
+    for file in files:
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def iter_batches(files, date=None):
+    columns = FEATURES + [TARGET] + [key for key in SPLIT_KEYS if key != 'date' or date is None]
+    for file in files:
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=BATCH_SIZE, columns=columns):
+            df = batch.to_pandas()
+            if date is not None:
+                df['date'] = date
+            df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+            yield df
+
+
+def train_streaming(path, state_path='streaming_linear_fit.joblib'):
+    model = joblib.load(state_path) if os.path.exists(state_path) else None
+    if model is not None and not hasattr(model, 'days'):
+        print(f"{state_path} predates per-day stats, retraining from scratch")
+        model = None
+    if model is None:
+        model = StreamingLinearRegression()
+    else:
+        print(f"Resuming from {state_path} ({len(model.days)} days seen)")
+
+    partitions = list_partitions(path)
+    changed, present = set(), set()
+    if None in partitions:
+        # Single file: every row is read, and each day is digested from its rows
+        pending = {}
+        for df in iter_batches(partitions[None]):
+            for date, day in df.groupby('date'):
+                if date not in pending:
+                    pending[date] = (hashlib.sha256(),) + model.day_stats()
+                sha, train_stats, test_stats = pending[date]
+                sha.update(pd.util.hash_pandas_object(day, index=False).to_numpy().tobytes())
+                model.accumulate(day, train_stats, test_stats)
+
+        present = set(pending)
+        for date, (sha, train_stats, test_stats) in pending.items():
+            if model.days.get(date, {}).get('digest') != sha.hexdigest():
+                model.set_day(date, sha.hexdigest(), train_stats, test_stats)
+                changed.add(date)
+    else:
+        # Partitions whose files are unchanged since the last run aren't read
+        present = set(partitions)
+        for date, files in partitions.items():
+            digest = partition_digest(files)
+            if model.days.get(date, {}).get('digest') == digest:
+                continue
+            if date in model.days:
+                print(f"Partition {date} changed since it was trained on, replacing its stats")
+            train_stats, test_stats = model.day_stats()
+            for df in iter_batches(files, date):
+                model.accumulate(df, train_stats, test_stats)
+            model.set_day(date, digest, train_stats, test_stats)
+            changed.add(date)
+
+    # Days that are no longer in the data stop counting
+    removed = set(model.days) - present
+    for date in removed:
+        model.drop_day(date)
+
+    if not changed and not removed:
+        print("No new or changed days to train on.")
+        return model
+
+    model.solve()
+    joblib.dump(model, state_path)
+
+    mse, r2 = model.score()
+    for feature, coef in zip(model.features, model.coef_):
+        print(f"{feature}: {coef}")
+    print(f"Trained on {model.train.n} rows, {len(changed)} new or changed days, {len(removed)} removed")
+    print(f"Mean Squared Error: {mse}")
+    print(f"Root Mean Squared Error: {np.sqrt(mse)}")
+    print(f"R-squared Score: {r2}")
+
+    return model
+
+
+if __name__ == "__main__":
+    # Import through the module so pickled state isn't bound to __main__
+    from streaming import train_streaming
+
+    path = sys.argv[1] if len(sys.argv) > 1 else 'sif_moisture_partitions'
+    train_streaming(path)
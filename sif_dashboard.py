@@ -4,8 +4,10 @@ from dash.dependencies import Input, Output
 import plotly.express as px
 import pandas as pd
 
-# Load data
-df = pd.read_parquet('oco3_sif.parquet')
+from data_service import open_table
+
+# Load data, shared with the other dashboards when data_service.py is running
+df = open_table('oco3_sif.parquet')
 
 print(f"Total rows: {len(df)}")
 
@@ -19,10 +21,10 @@ app.layout = html.Div([
             html.Label("Latitude Range:"),
             dcc.RangeSlider(
                 id='lat-range-slider',
-                min=df['latitude'].min(),
-                max=df['latitude'].max(),
-                value=[df['latitude'].min(), df['latitude'].max()],
-                marks={i: f'{i:.1f}' for i in range(int(df['latitude'].min()), int(df['latitude'].max()) + 1, 2)},
+                min=df.min('latitude'),
+                max=df.max('latitude'),
+                value=[df.min('latitude'), df.max('latitude')],
+                marks={i: f'{i:.1f}' for i in range(int(df.min('latitude')), int(df.max('latitude')) + 1, 2)},
                 step=0.1
             ),
         ], style={'width': '48%', 'display': 'inline-block'}),
@@ -30,10 +32,10 @@ app.layout = html.Div([
             html.Label("Longitude Range:"),
             dcc.RangeSlider(
                 id='lon-range-slider',
-                min=df['longitude'].min(),
-                max=df['longitude'].max(),
-                value=[df['longitude'].min(), df['longitude'].max()],
-                marks={i: f'{i:.1f}' for i in range(int(df['longitude'].min()), int(df['longitude'].max()) + 1, 2)},
+                min=df.min('longitude'),
+                max=df.max('longitude'),
+                value=[df.min('longitude'), df.max('longitude')],
+                marks={i: f'{i:.1f}' for i in range(int(df.min('longitude')), int(df.max('longitude')) + 1, 2)},
                 step=0.1
             ),
         ], style={'width': '48%', 'float': 'right', 'display': 'inline-block'})
@@ -49,10 +51,10 @@ app.layout = html.Div([
     ),
     dcc.DatePickerSingle(
         id='date-picker',
-        min_date_allowed=df['date'].min(),
-        max_date_allowed=df['date'].max(),
-        initial_visible_month=df['date'].min(),
-        date=df['date'].min()
+        min_date_allowed=df.min('date'),
+        max_date_allowed=df.max('date'),
+        initial_visible_month=df.min('date'),
+        date=df.min('date')
     ),
     html.Div(id='date-display')
 ])
@@ -67,11 +69,10 @@ app.layout = html.Div([
 )
 def update_map(selected_date, data_type, lat_range, lon_range):
     selected_date = pd.to_datetime(selected_date)
-    filtered_df = df[
-        (df['date'] == selected_date) &
-        (df['latitude'].between(lat_range[0], lat_range[1])) &
-        (df['longitude'].between(lon_range[0], lon_range[1]))
-    ]
+    filtered_df = df.query(
+        equals={'date': selected_date},
+        between={'latitude': tuple(lat_range), 'longitude': tuple(lon_range)},
+    )
 
     fig = px.scatter_mapbox(filtered_df,
                             lat="latitude",
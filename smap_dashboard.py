@@ -1,18 +1,24 @@
+import os
+import sys
+
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 import plotly.express as px
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_pipeline'))
+from moisture_cube import MoistureCube
+
 ARONDALE_LAT = 38.223
 ARONDALE_LONG = -104.343
 DEFAULT_LAT_RANGE = 5
 DEFAULT_LONG_RANGE = 20
 
-# Load data
-df = pd.read_parquet('moisture.parquet')
+# Memory-mapped chunks; each update reads only the selected step and box
+cube = MoistureCube('moisture_cube')
 
-print(f"Total rows: {len(df)}")
+print(f"Cube shape: {cube.shape}")
 
 app = dash.Dash(__name__)
 
@@ -43,12 +49,12 @@ app.layout = html.Div([
     ),
     dcc.Slider(
         id='datetime-slider',
-        min=df['date_time'].min().timestamp(),
-        max=df['date_time'].max().timestamp(),
-        value=df['date_time'].min().timestamp(),
+        min=cube.times.min().timestamp(),
+        max=cube.times.max().timestamp(),
+        value=cube.times.min().timestamp(),
         marks={int(date.timestamp()): date.strftime('%m-%d')
-               for date in pd.date_range(start=df['date_time'].min(),
-                                         end=df['date_time'].max(),
+               for date in pd.date_range(start=cube.times.min(),
+                                         end=cube.times.max(),
                                          freq='D')},  # Daily marks for readability
         step=None
     ),
@@ -70,12 +76,9 @@ def update_map(n_clicks, selected_timestamp, moisture_type, lat_min, lat_max, lo
     # Convert selected timestamp to datetime
     selected_datetime = pd.to_datetime(selected_timestamp, unit='s')
 
-    # Filter DataFrame based on selected datetime and lat/lon ranges
-    filtered_df = df[
-        (df['date_time'] == selected_datetime) &
-        (df['latitude'].between(lat_min, lat_max)) &
-        (df['longitude'].between(lon_min, lon_max))
-    ]
+    # Read just the selected time step inside the lat/lon ranges
+    filtered_df = cube.to_frame(start=selected_datetime, end=selected_datetime,
+                                lat_min=lat_min, lat_max=lat_max, lon_min=lon_min, lon_max=lon_max)
 
     # Create scatter mapbox figure
     fig = px.scatter_mapbox(filtered_df,